@@ -1,6 +1,9 @@
 from .models import BidirectionalAttentionFlow
 from .scripts import load_data_generators
-from .scripts import data_download_and_preprocess, negative_avg_log_error, accuracy
+from .scripts import data_download_and_preprocess
+from .scripts import compile_squad_dataset, load_embedding_matrix, build_squad_embedding_subset
+from .scripts import BM25Index, build_bm25_index
+from .scripts import serve, predict_file
 import os
 
 # =======================================================================================================================
@@ -21,6 +24,16 @@ parser.add_argument('--model_name', type=str, action='store', default=None,
                     help='Model to load for predictions/resume training')
 parser.add_argument('-e', '--emdim', choices=[350, 400, 500, 600],
                     action='store', default=400, help='Embedding (GLoVE + Fasttext) vectors dimension')
+parser.add_argument('-uem', '--use_embedding_matrix', action='store_true', default=False,
+                    help='Feed token IDs to the model and embed them with a precomputed, frozen embedding matrix')
+parser.add_argument('-ues', '--use_embedding_subset', action='store_true', default=False,
+                    help='Load only the word vectors of the SQuAD vocabulary instead of the full Magnitude models')
+parser.add_argument('-ol', '--output_logits', action='store_true', default=False,
+                    help='Output span logits and train with a fused log-softmax loss')
+parser.add_argument('-pw', '--preprocessing_workers', type=int, action='store', default=1,
+                    help='Number of processes tokenizing the SQuAD articles during preprocessing')
+parser.add_argument('-t', '--tokenizer', choices=['nltk', 'regex'], action='store', default='nltk',
+                    help='Tokenizer of the dataset, the indexed paragraphs and the inputs of predictions')
 parser.add_argument('-nhl', '--num_highway_layers', type=int, action='store',
                     default=1, help='Number of Highway layers')
 parser.add_argument('-nd', '--num_decoders', type=int, action='store', default=1, help='Number of decoders')
@@ -37,6 +50,18 @@ parser_train.add_argument('-ss', '--shuffle_samples', action='store_true',
                           default=False, help='Shuffle samples in batch at epoch end')
 parser_train.add_argument('-spe', '--steps_per_epochs', type=int, action='store', default=None, help='Steps per epoch')
 parser_train.add_argument('-vs', '--validation_steps', type=int, action='store', default=None, help='Validation steps')
+parser_train.add_argument('-ucd', '--use_compiled_dataset', action='store_true', default=False,
+                          help='Train from the compiled, memory-mapped version of the preprocessed dataset')
+parser_train.add_argument('-bb', '--bucket_boundaries', type=int, nargs='+', action='store', default=None,
+                          help='Passage lengths at which a new bucket starts, batches only mix passages of one bucket')
+parser_train.add_argument('-pd', '--prefetch_depth', type=int, action='store', default=None,
+                          help='Build batches this many steps ahead in background threads instead of Keras workers')
+parser_train.add_argument('-pt', '--prefetch_threads', type=int, action='store', default=2,
+                          help='Number of threads building batches ahead when prefetching')
+parser_train.add_argument('-lt', '--log_throughput', action='store_true', default=False,
+                          help='Log examples/sec, tokens/sec, data wait and compute times per epoch and peak memory')
+parser_train.add_argument('-tb', '--tensorboard_dir', type=str, action='store', default=None,
+                          help='Write the epoch logs to TensorBoard event files in this directory')
 parser_train.add_argument('-w', '--workers', type=int, action='store', default=1, help='Number of workers')
 parser_train.add_argument('--use_multiprocessing', action='store_true', default=False, help='Use multiprocessing')
 parser_train.add_argument('-sb', '--shuffle_batch', action='store_true',
@@ -51,8 +76,14 @@ required_train.add_argument('--epochs', type=int, action='store', required=True,
 
 # create the parser for the "predict" command
 parser_predict = subparsers.add_parser('predict', help='Run predictions on BiDAF')
-parser_predict.add_argument('-mal', '--max_ans_length', action='store',
+parser_predict.add_argument('-mal', '--max_ans_length', type=int, action='store',
                             default=25, help='Maximum answer length')
+parser_predict.add_argument('-k', '--top_k', type=int, action='store', default=None,
+                            help='Return the k best non-overlapping answers instead of the best one')
+parser_predict.add_argument('-ws', '--window_size', type=int, action='store', default=None,
+                            help='Read the passage through overlapping windows of this many tokens')
+parser_predict.add_argument('-wst', '--window_stride', type=int, action='store', default=None,
+                            help='Tokens between the starts of two windows, half a window by default')
 parser_predict.add_argument('-rcl', '--return_char_loc', action='store_true', default=False,
                             help='Return answer start and end character locations')
 parser_predict.add_argument('-rcs', '--return_confidence_score', action='store_true',
@@ -62,6 +93,66 @@ required_predict = parser_predict.add_argument_group('required arguments')
 required_predict.add_argument('-p', '--passage', type=str, action='store', required=True, help='Input passage')
 required_predict.add_argument('-q', '--question', type=str, action='store', required=True, help='Input question')
 
+# create the parser for the "predict-file" command
+parser_predict_file = subparsers.add_parser('predict-file', help='Run predictions on a JSONL or SQuAD-format file',
+                                            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser_predict_file.add_argument('-mal', '--max_ans_length', type=int, action='store',
+                                 default=25, help='Maximum answer length')
+parser_predict_file.add_argument('-k', '--top_k', type=int, action='store', default=None,
+                                 help='Return the k best non-overlapping answers instead of the best one')
+parser_predict_file.add_argument('-rcl', '--return_char_loc', action='store_true', default=False,
+                                 help='Return answer start and end character locations')
+parser_predict_file.add_argument('-rcs', '--return_confidence_score', action='store_true',
+                                 default=False, help='Return confidence value of the answer')
+parser_predict_file.add_argument('-bs', '--batch_size', type=int, action='store', default=32, help='Batch size')
+parser_predict_file.add_argument('-cs', '--chunk_size', type=int, action='store', default=1000,
+                                 help='Number of examples read, sorted by length and predicted together')
+
+required_predict_file = parser_predict_file.add_argument_group('required arguments')
+required_predict_file.add_argument('-i', '--input_file', type=str, action='store', required=True,
+                                   help='JSONL file of {"id", "passage", "question"} objects or SQuAD JSON file')
+required_predict_file.add_argument('-o', '--output_file', type=str, action='store', required=True,
+                                   help='JSONL file the predictions are written to')
+
+# create the parser for the "serve" command
+parser_serve = subparsers.add_parser('serve', help='Serve predictions over HTTP',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser_serve.add_argument('--host', type=str, action='store', default='localhost', help='Host to listen on')
+parser_serve.add_argument('--port', type=int, action='store', default=8000, help='Port to listen on')
+parser_serve.add_argument('-mbs', '--max_batch_size', type=int, action='store', default=32,
+                          help='Maximum number of requests run in one batch')
+parser_serve.add_argument('-mwm', '--max_wait_ms', type=float, action='store', default=10,
+                          help='Maximum time a request waits for other requests to join its batch')
+parser_serve.add_argument('-mal', '--max_ans_length', type=int, action='store',
+                          default=25, help='Maximum answer length')
+
+# create the parser for the "index" command
+parser_index = subparsers.add_parser('index', help='Add paragraphs to a BM25 index for open-corpus QA',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser_index.add_argument('-ss', '--segment_size', type=int, action='store', default=100000,
+                          help='Number of paragraphs per index segment')
+
+required_index = parser_index.add_argument_group('required arguments')
+required_index.add_argument('-c', '--corpus', type=str, nargs='+', action='store', required=True,
+                            help='Text files holding one paragraph per line')
+required_index.add_argument('-id', '--index_dir', type=str, action='store', required=True, help='Index directory')
+
+# create the parser for the "retrieve" command
+parser_retrieve = subparsers.add_parser('retrieve', help='Answer a question from the paragraphs of a BM25 index',
+                                        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser_retrieve.add_argument('-np', '--num_paragraphs', type=int, action='store', default=5,
+                             help='Number of retrieved paragraphs read by the model')
+parser_retrieve.add_argument('-mal', '--max_ans_length', type=int, action='store',
+                             default=25, help='Maximum answer length')
+parser_retrieve.add_argument('-rcl', '--return_char_loc', action='store_true', default=False,
+                             help='Return answer start and end character locations')
+parser_retrieve.add_argument('-rcs', '--return_confidence_score', action='store_true',
+                             default=False, help='Return confidence value of the answer')
+
+required_retrieve = parser_retrieve.add_argument_group('required arguments')
+required_retrieve.add_argument('-id', '--index_dir', type=str, action='store', required=True, help='Index directory')
+required_retrieve.add_argument('-q', '--question', type=str, action='store', required=True, help='Input question')
+
 
 # ========================================================================================================================
 
@@ -72,30 +163,55 @@ def main():
         sys.exit()
     args = parser.parse_args()
 
-    data_download_and_preprocess(squad_version=args.squad_version, do_lowercase=args.do_lowercase)
+    if args.which == 'index':
+        index = build_bm25_index(args.corpus, args.index_dir, do_lowercase=args.do_lowercase,
+                                 segment_size=args.segment_size, tokenizer=args.tokenizer)
+        print("Index holds {} paragraphs".format(len(index)))
+        return
+
+    data_download_and_preprocess(squad_version=args.squad_version, do_lowercase=args.do_lowercase,
+                                 num_workers=args.preprocessing_workers, tokenizer=args.tokenizer)
+
+    vocab, embedding_matrix = None, None
+    if args.use_embedding_matrix:
+        compile_squad_dataset(squad_version=args.squad_version)
+        vocab, embedding_matrix = load_embedding_matrix(args.squad_version, args.emdim)
+
+    embedding_subset = None
+    if args.use_embedding_subset:
+        embedding_subset = build_squad_embedding_subset(args.squad_version, args.emdim)
 
     bidaf_model = BidirectionalAttentionFlow(emdim=args.emdim, max_passage_length=args.max_passage_length,
                                              max_query_length=args.max_query_length,
                                              num_highway_layers=args.num_highway_layers, num_decoders=args.num_decoders,
-                                             encoder_dropout=args.encoder_dropout, decoder_dropout=args.decoder_dropout)
+                                             encoder_dropout=args.encoder_dropout, decoder_dropout=args.decoder_dropout,
+                                             vocab=vocab, embedding_matrix=embedding_matrix,
+                                             embedding_subset=embedding_subset, output_logits=args.output_logits)
 
     if args.which == 'train':
 
         if args.model_name is not None:
             bidaf_model.load_bidaf(os.path.join(os.path.dirname(__file__), 'saved_items', args.model_name))
-            bidaf_model.model.compile(loss=negative_avg_log_error, optimizer='adadelta', metrics=[accuracy])
+            loss, metric = bidaf_model.get_loss_and_metric()
+            bidaf_model.model.compile(loss=loss, optimizer='adadelta', metrics=[metric])
 
         train_generator, validation_generator = load_data_generators(batch_size=args.batch_size, emdim=args.emdim,
                                                                      squad_version=args.squad_version,
                                                                      max_passage_length=args.max_passage_length,
                                                                      max_query_length=args.max_query_length,
-                                                                     shuffle=args.shuffle_samples)
+                                                                     shuffle=args.shuffle_samples,
+                                                                     use_compiled_dataset=args.use_compiled_dataset,
+                                                                     return_token_ids=args.use_embedding_matrix,
+                                                                     embedding_subset=embedding_subset,
+                                                                     bucket_boundaries=args.bucket_boundaries)
 
         bidaf_model.train_model(train_generator, steps_per_epoch=args.steps_per_epochs, epochs=args.epochs,
                                 validation_generator=validation_generator, validation_steps=args.validation_steps,
                                 workers=args.workers, use_multiprocessing=args.use_multiprocessing,
                                 shuffle=args.shuffle_batch, save_history=args.save_history,
-                                save_model_per_epoch=args.save_model_per_epoch)
+                                save_model_per_epoch=args.save_model_per_epoch,
+                                prefetch_depth=args.prefetch_depth, prefetch_threads=args.prefetch_threads,
+                                log_throughput=args.log_throughput, tensorboard_dir=args.tensorboard_dir)
 
         print("Training Completed!")
 
@@ -113,7 +229,57 @@ def main():
         answer = bidaf_model.predict_ans(args.passage, args.question, squad_version=args.squad_version,
                                          max_span_length=args.max_ans_length,
                                          do_lowercase=args.do_lowercase, return_char_loc=args.return_char_loc,
-                                         return_confidence_score=args.return_confidence_score)
+                                         return_confidence_score=args.return_confidence_score, top_k=args.top_k,
+                                         window_size=args.window_size, window_stride=args.window_stride,
+                                         tokenizer=args.tokenizer)
+
+        print("Predicted answer:", answer)
+
+    if args.which == 'predict-file':
+        if args.model_name is None:
+            print("You must specify a model to run predictions on it.", file=sys.stderr)
+            sys.exit(1)
+
+        bidaf_model.load_bidaf(os.path.join(os.path.dirname(__file__), 'saved_items', args.model_name))
+
+        num_examples = predict_file(bidaf_model, args.input_file, args.output_file, squad_version=args.squad_version,
+                                    max_span_length=args.max_ans_length, do_lowercase=args.do_lowercase,
+                                    return_char_loc=args.return_char_loc,
+                                    return_confidence_score=args.return_confidence_score, top_k=args.top_k,
+                                    chunk_size=args.chunk_size, batch_size=args.batch_size,
+                                    tokenizer=args.tokenizer)
+
+        print("Predicted {} answers to {}".format(num_examples, args.output_file))
+
+    if args.which == 'serve':
+        if args.model_name is None:
+            print("You must specify a model to run predictions on it.", file=sys.stderr)
+            sys.exit(1)
+
+        bidaf_model.load_bidaf(os.path.join(os.path.dirname(__file__), 'saved_items', args.model_name))
+
+        serve(bidaf_model, host=args.host, port=args.port, max_batch_size=args.max_batch_size,
+              max_wait_ms=args.max_wait_ms, squad_version=args.squad_version, max_span_length=args.max_ans_length,
+              do_lowercase=args.do_lowercase, tokenizer=args.tokenizer)
+
+    if args.which == 'retrieve':
+        if args.model_name is None:
+            print("You must specify a model to run predictions on it.", file=sys.stderr)
+            sys.exit(1)
+
+        print("Your question:", args.question)
+        print("Retrieving paragraphs and predicting answer...")
+
+        bidaf_model.load_bidaf(os.path.join(os.path.dirname(__file__), 'saved_items', args.model_name))
+
+        answer = bidaf_model.predict_ans_from_index(args.question, BM25Index(args.index_dir),
+                                                    num_paragraphs=args.num_paragraphs,
+                                                    squad_version=args.squad_version,
+                                                    max_span_length=args.max_ans_length,
+                                                    do_lowercase=args.do_lowercase,
+                                                    return_char_loc=args.return_char_loc,
+                                                    return_confidence_score=args.return_confidence_score,
+                                                    tokenizer=args.tokenizer)
 
         print("Predicted answer:", answer)
 
@@ -6,3 +6,5 @@ from .merged_context import MergedContext
 from .span_begin import SpanBegin
 from .span_end import SpanEnd
 from .combine_outputs import CombineOutputs
+from .top_k_spans import TopKSpans
+from .attach_mask import AttachMask
@@ -0,0 +1,29 @@
+from keras.engine.topology import Layer
+from keras import backend as K
+
+
+class AttachMask(Layer):
+
+    def __init__(self, **kwargs):
+        super(AttachMask, self).__init__(**kwargs)
+        self.supports_masking = True
+
+    def build(self, input_shape):
+        super(AttachMask, self).build(input_shape)
+
+    def call(self, inputs, mask=None):
+        # passes the sequence through, the second input only provides its mask (1 for words, 0 for padding)
+        sequence, _ = inputs
+        return sequence
+
+    def compute_mask(self, inputs, mask=None):
+        _, sequence_mask = inputs
+        return K.cast(sequence_mask, 'bool')
+
+    def compute_output_shape(self, input_shape):
+        sequence_shape, _ = input_shape
+        return sequence_shape
+
+    def get_config(self):
+        config = super().get_config()
+        return config
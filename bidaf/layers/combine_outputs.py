@@ -6,6 +6,7 @@ class CombineOutputs(Layer):
 
     def __init__(self, **kwargs):
         super(CombineOutputs, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         super(CombineOutputs, self).build(input_shape)
@@ -14,6 +15,9 @@ class CombineOutputs(Layer):
         span_begin_probabilities, span_end_probabilities = inputs
         return K.stack([span_begin_probabilities, span_end_probabilities], axis = 1)
 
+    def compute_mask(self, inputs, mask=None):
+        return None
+
     def compute_output_shape(self, input_shape):
         number_of_tensors = len(input_shape)
         return input_shape[0][0:1] + (number_of_tensors, ) + input_shape[0][1:]
@@ -1,22 +1,30 @@
 from keras.engine.topology import Layer
-from keras.layers.advanced_activations import Softmax
 from keras import backend as K
+from .masking import masked_softmax
 
 
 class C2QAttention(Layer):
 
     def __init__(self, **kwargs):
         super(C2QAttention, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         super(C2QAttention, self).build(input_shape)
 
-    def call(self, inputs):
+    def call(self, inputs, mask=None):
         similarity_matrix, encoded_question = inputs
-        context_to_query_attention = Softmax(axis=-1)(similarity_matrix)
+        similarity_mask = None if mask is None else mask[0]
+        context_to_query_attention = masked_softmax(similarity_matrix, similarity_mask, axis=-1)
         encoded_question = K.expand_dims(encoded_question, axis=1)
         return K.sum(K.expand_dims(context_to_query_attention, axis=-1) * encoded_question, -2)
 
+    def compute_mask(self, inputs, mask=None):
+        # a context word is valid if it is valid with at least one query word
+        if mask is None or mask[0] is None:
+            return None
+        return K.any(mask[0], axis=-1)
+
     def compute_output_shape(self, input_shape):
         similarity_matrix_shape, encoded_question_shape = input_shape
         return similarity_matrix_shape[:-1] + encoded_question_shape[-1:]
@@ -13,6 +13,7 @@ class Highway(Layer):
         self.activation = activation
         self.transform_gate_bias = transform_gate_bias
         super(Highway, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         # Create a trainable weight variable for this layer.
@@ -0,0 +1,16 @@
+from keras import backend as K
+
+# added to the logits of padded positions, exp() of it underflows to exactly 0
+VERY_NEGATIVE_NUMBER = -1e30
+
+
+def mask_logits(logits, mask):
+    if mask is None:
+        return logits
+    return logits + (1.0 - K.cast(mask, K.floatx())) * VERY_NEGATIVE_NUMBER
+
+
+def masked_softmax(logits, mask, axis=-1):
+    """Softmax which gives no probability to the positions where mask is False. A fully masked row comes out uniform,
+    such rows only belong to padded positions which are masked again further down the graph."""
+    return K.softmax(mask_logits(logits, mask), axis=axis)
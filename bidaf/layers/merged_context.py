@@ -6,6 +6,7 @@ class MergedContext(Layer):
 
     def __init__(self, **kwargs):
         super(MergedContext, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         super(MergedContext, self).build(input_shape)
@@ -18,6 +19,11 @@ class MergedContext(Layer):
             [encoded_context, context_to_query_attention, element_wise_multiply1, element_wise_multiply2], axis=-1)
         return concatenated_tensor
 
+    def compute_mask(self, inputs, mask=None):
+        if mask is None:
+            return None
+        return mask[0]
+
     def compute_output_shape(self, input_shape):
         encoded_context_shape, _, _ = input_shape
         return encoded_context_shape[:-1] + (encoded_context_shape[-1] * 4, )
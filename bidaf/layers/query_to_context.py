@@ -1,26 +1,33 @@
 from keras.engine.topology import Layer
-from keras.layers.advanced_activations import Softmax
 from keras import backend as K
+from .masking import mask_logits, masked_softmax
 
 
 class Q2CAttention(Layer):
 
     def __init__(self, **kwargs):
         super(Q2CAttention, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         super(Q2CAttention, self).build(input_shape)
 
-    def call(self, inputs):
+    def call(self, inputs, mask=None):
         similarity_matrix, encoded_context = inputs
-        max_similarity = K.max(similarity_matrix, axis=-1)
-        # by default, axis = -1 in Softmax
-        context_to_query_attention = Softmax()(max_similarity)
+        similarity_mask = None if mask is None else mask[0]
+        max_similarity = K.max(mask_logits(similarity_matrix, similarity_mask), axis=-1)
+        context_mask = self.compute_mask(inputs, mask)
+        context_to_query_attention = masked_softmax(max_similarity, context_mask, axis=-1)
         weighted_sum = K.sum(K.expand_dims(context_to_query_attention, axis=-1) * encoded_context, -2)
         expanded_weighted_sum = K.expand_dims(weighted_sum, 1)
         num_of_repeatations = K.shape(encoded_context)[1]
         return K.tile(expanded_weighted_sum, [1, num_of_repeatations, 1])
 
+    def compute_mask(self, inputs, mask=None):
+        if mask is None or mask[0] is None:
+            return None
+        return K.any(mask[0], axis=-1)
+
     def compute_output_shape(self, input_shape):
         similarity_matrix_shape, encoded_context_shape = input_shape
         return similarity_matrix_shape[:-1] + encoded_context_shape[-1:]
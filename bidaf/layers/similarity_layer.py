@@ -7,13 +7,20 @@ class Similarity(Layer):
 
     def __init__(self, **kwargs):
         super(Similarity, self).__init__(**kwargs)
+        self.supports_masking = True
 
-    def compute_similarity(self, repeated_context_vectors, repeated_query_vectors):
-        element_wise_multiply = repeated_context_vectors * repeated_query_vectors
-        concatenated_tensor = K.concatenate(
-            [repeated_context_vectors, repeated_query_vectors, element_wise_multiply], axis=-1)
-        dot_product = K.squeeze(K.dot(concatenated_tensor, self.kernel), axis=-1)
-        return linear(dot_product + self.bias)
+    def compute_similarity(self, context_vectors, query_vectors):
+        # w . [c; q; c * q] is computed as (c . w1) + (q . w2) + (c * w3) . q, which never materializes the
+        # (P, Q, 3 * dim) tensor of concatenated context-query pairs
+        word_vector_dim = K.int_shape(context_vectors)[-1]
+        context_weights = self.kernel[:word_vector_dim]
+        query_weights = self.kernel[word_vector_dim:2 * word_vector_dim]
+        multiply_weights = self.kernel[2 * word_vector_dim:, 0]
+
+        context_scores = K.dot(context_vectors, context_weights)
+        query_scores = K.permute_dimensions(K.dot(query_vectors, query_weights), (0, 2, 1))
+        multiply_scores = K.batch_dot(context_vectors * multiply_weights, query_vectors, axes=[2, 2])
+        return linear(context_scores + query_scores + multiply_scores + self.bias)
 
     def build(self, input_shape):
         word_vector_dim = input_shape[0][-1]
@@ -28,17 +35,20 @@ class Similarity(Layer):
                                     trainable=True)
         super(Similarity, self).build(input_shape)
 
-    def call(self, inputs):
+    def call(self, inputs, mask=None):
         context_vectors, query_vectors = inputs
-        num_context_words = K.shape(context_vectors)[1]
-        num_query_words = K.shape(query_vectors)[1]
-        context_dim_repeat = K.concatenate([[1, 1], [num_query_words], [1]], 0)
-        query_dim_repeat = K.concatenate([[1], [num_context_words], [1, 1]], 0)
-        repeated_context_vectors = K.tile(K.expand_dims(context_vectors, axis=2), context_dim_repeat)
-        repeated_query_vectors = K.tile(K.expand_dims(query_vectors, axis=1), query_dim_repeat)
-        similarity_matrix = self.compute_similarity(repeated_context_vectors, repeated_query_vectors)
+        similarity_matrix = self.compute_similarity(context_vectors, query_vectors)
         return similarity_matrix
 
+    def compute_mask(self, inputs, mask=None):
+        # the similarity of a (context word, query word) pair is only valid if neither of them is padding
+        if mask is None or mask[0] is None or mask[1] is None:
+            return None
+        context_mask, query_mask = mask
+        pair_mask = K.expand_dims(K.cast(context_mask, 'float32'), axis=2) * \
+            K.expand_dims(K.cast(query_mask, 'float32'), axis=1)
+        return K.cast(pair_mask, 'bool')
+
     def compute_output_shape(self, input_shape):
         batch_size = input_shape[0][0]
         num_context_words = input_shape[0][1]
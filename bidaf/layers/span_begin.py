@@ -1,13 +1,15 @@
 from keras.engine.topology import Layer
-from keras.layers.advanced_activations import Softmax
 from keras.layers import TimeDistributed, Dense
 from keras import backend as K
+from .masking import mask_logits, masked_softmax
 
 
 class SpanBegin(Layer):
 
-    def __init__(self, **kwargs):
+    def __init__(self, return_logits=False, **kwargs):
+        self.return_logits = return_logits
         super(SpanBegin, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         last_dim = input_shape[0][-1] + input_shape[1][-1]
@@ -17,17 +19,25 @@ class SpanBegin(Layer):
         self.trainable_weights = self.dense_1.trainable_weights
         super(SpanBegin, self).build(input_shape)
 
-    def call(self, inputs):
+    def call(self, inputs, mask=None):
         merged_context, modeled_passage = inputs
+        passage_mask = None if mask is None else mask[0]
         span_begin_input = K.concatenate([merged_context, modeled_passage])
         span_begin_weights = TimeDistributed(self.dense_1)(span_begin_input)
-        span_begin_probabilities = Softmax()(K.squeeze(span_begin_weights, axis=-1))
+        span_begin_weights = K.squeeze(span_begin_weights, axis=-1)
+        if self.return_logits:
+            return mask_logits(span_begin_weights, passage_mask)
+        span_begin_probabilities = masked_softmax(span_begin_weights, passage_mask)
         return span_begin_probabilities
 
+    def compute_mask(self, inputs, mask=None):
+        return None
+
     def compute_output_shape(self, input_shape):
         merged_context_shape, _ = input_shape
         return merged_context_shape[:-1]
 
     def get_config(self):
         config = super().get_config()
+        config['return_logits'] = self.return_logits
         return config
@@ -1,13 +1,16 @@
 from keras.engine.topology import Layer
-from keras.layers.advanced_activations import Softmax
 from keras.layers import TimeDistributed, Dense, LSTM, Bidirectional
 from keras import backend as K
+from .masking import mask_logits, masked_softmax
 
 
 class SpanEnd(Layer):
 
-    def __init__(self, **kwargs):
+    def __init__(self, return_logits=False, **kwargs):
+        # with return_logits, the span begin input is expected to hold logits as well
+        self.return_logits = return_logits
         super(SpanEnd, self).__init__(**kwargs)
+        self.supports_masking = True
 
     def build(self, input_shape):
         emdim = input_shape[0][-1] // 2
@@ -20,8 +23,11 @@ class SpanEnd(Layer):
         self.trainable_weights = self.bilstm_1.trainable_weights + self.dense_1.trainable_weights
         super(SpanEnd, self).build(input_shape)
 
-    def call(self, inputs):
+    def call(self, inputs, mask=None):
         encoded_passage, merged_context, modeled_passage, span_begin_probabilities = inputs
+        passage_mask = None if mask is None else mask[0]
+        if self.return_logits:
+            span_begin_probabilities = masked_softmax(span_begin_probabilities, passage_mask)
         weighted_sum = K.sum(K.expand_dims(span_begin_probabilities, axis=-1) * modeled_passage, -2)
         passage_weighted_by_predicted_span = K.expand_dims(weighted_sum, axis=1)
         tile_shape = K.concatenate([[1], [K.shape(encoded_passage)[1]], [1]], axis=0)
@@ -30,19 +36,26 @@ class SpanEnd(Layer):
         span_end_representation = K.concatenate(
             [merged_context, modeled_passage, passage_weighted_by_predicted_span, multiply1])
 
-        span_end_representation = self.bilstm_1(span_end_representation)
+        span_end_representation = self.bilstm_1(span_end_representation, mask=passage_mask)
 
         span_end_input = K.concatenate([merged_context, span_end_representation])
 
         span_end_weights = TimeDistributed(self.dense_1)(span_end_input)
 
-        span_end_probabilities = Softmax()(K.squeeze(span_end_weights, axis=-1))
+        span_end_weights = K.squeeze(span_end_weights, axis=-1)
+        if self.return_logits:
+            return mask_logits(span_end_weights, passage_mask)
+        span_end_probabilities = masked_softmax(span_end_weights, passage_mask)
         return span_end_probabilities
 
+    def compute_mask(self, inputs, mask=None):
+        return None
+
     def compute_output_shape(self, input_shape):
         _, merged_context_shape, _, _ = input_shape
         return merged_context_shape[:-1]
 
     def get_config(self):
         config = super().get_config()
+        config['return_logits'] = self.return_logits
         return config
@@ -0,0 +1,73 @@
+from keras.engine.topology import Layer
+from keras import backend as K
+
+
+class TopKSpans(Layer):
+
+    def __init__(self, top_k=1, max_span_length=25, squad_version=1.1, from_logits=False, **kwargs):
+        self.top_k = top_k
+        self.max_span_length = max_span_length
+        self.squad_version = squad_version
+        self.from_logits = from_logits
+        super(TopKSpans, self).__init__(**kwargs)
+
+    def build(self, input_shape):
+        super(TopKSpans, self).build(input_shape)
+
+    def call(self, inputs):
+        span_probabilities, passage_length = inputs
+        if self.from_logits:
+            span_probabilities = K.softmax(span_probabilities, axis=-1)
+        span_begin_probabilities = span_probabilities[:, 0, :]
+        span_end_probabilities = span_probabilities[:, 1, :]
+        num_context_words = K.shape(span_begin_probabilities)[1]
+        band_width = self.max_span_length
+
+        # only the band of spans (i, i + d) with 0 <= d < max_span_length is scored, as a (P, max_span_length) grid.
+        # The end probabilities are padded so that the spans running past the passage get a score of 0.
+        padded_end_probabilities = K.concatenate(
+            [span_end_probabilities, K.zeros_like(K.tile(span_end_probabilities[:, :1], [1, band_width]))], axis=1)
+        band_end_probabilities = K.stack([padded_end_probabilities[:, d:d + num_context_words]
+                                          for d in range(band_width)], axis=2)
+        span_scores = K.expand_dims(span_begin_probabilities, axis=2) * band_end_probabilities
+
+        positions = K.arange(num_context_words * band_width)
+        span_begins = positions // band_width
+        span_ends = span_begins + positions % band_width
+        in_passage = K.cast(K.less(K.expand_dims(span_ends, axis=0), K.cast(passage_length, 'int32')), 'float32')
+
+        span_scores = K.reshape(span_scores, (-1, num_context_words * band_width)) * in_passage
+        if self.squad_version == 2.0:
+            # position 0 stands for "no answer", it may only form the null span (0, 0), which is band position 0
+            span_scores *= K.expand_dims(K.cast(K.greater(span_begins, 0), 'float32'), axis=0)
+            null_span = K.cast(K.equal(positions, 0), 'float32')
+            null_score = span_begin_probabilities[:, 0] * span_end_probabilities[:, 0]
+            span_scores += K.expand_dims(null_span, axis=0) * K.expand_dims(null_score, axis=-1)
+
+        # greedily pick the best span, then drop every span overlapping with it
+        top_spans = []
+        for _ in range(self.top_k):
+            best_span = K.cast(K.argmax(span_scores, axis=-1), 'int32')
+            best_score = K.max(span_scores, axis=-1)
+            best_begin = best_span // band_width
+            best_end = best_begin + best_span % band_width
+            top_spans.append(K.stack([K.cast(best_begin, 'float32'), K.cast(best_end, 'float32'), best_score], axis=-1))
+
+            overlapping = K.cast(K.less_equal(K.expand_dims(span_begins, axis=0), K.expand_dims(best_end, axis=-1)),
+                                 'float32') * \
+                K.cast(K.greater_equal(K.expand_dims(span_ends, axis=0), K.expand_dims(best_begin, axis=-1)), 'float32')
+            span_scores = span_scores * (1.0 - overlapping)
+
+        return K.stack(top_spans, axis=1)
+
+    def compute_output_shape(self, input_shape):
+        span_probabilities_shape, _ = input_shape
+        return span_probabilities_shape[0:1] + (self.top_k, 3)
+
+    def get_config(self):
+        config = super().get_config()
+        config['top_k'] = self.top_k
+        config['max_span_length'] = self.max_span_length
+        config['squad_version'] = self.squad_version
+        config['from_logits'] = self.from_logits
+        return config
@@ -1,27 +1,56 @@
-from keras.layers import Input, TimeDistributed, LSTM, Bidirectional
+from keras.layers import Input, TimeDistributed, LSTM, Bidirectional, Embedding, Masking
 from keras.models import Model, load_model
 from keras.optimizers import Adadelta
-from keras.callbacks import CSVLogger, ModelCheckpoint
+from keras import backend as K
+from keras.callbacks import CSVLogger, ModelCheckpoint, TensorBoard
 from ..layers import Highway, Similarity, C2QAttention, Q2CAttention, MergedContext, SpanBegin, SpanEnd, CombineOutputs
-from ..scripts import negative_avg_log_error, accuracy, tokenize, MagnitudeVectors, get_best_span, \
-    get_word_char_loc_mapping
+from ..layers import TopKSpans, AttachMask
+from ..scripts import negative_avg_log_error, negative_avg_log_error_from_logits, accuracy, accuracy_from_logits
+from ..scripts import tokenize, tokenize_with_offsets, MagnitudeVectors, get_best_span_batch, \
+    get_word_char_loc_mapping, softmax, sequence_mask, get_window_starts, merge_window_candidates, check_window
 from ..scripts import ModelMGPU
+from ..scripts import Prefetcher, PrefetchStats, ThroughputLogger
+from ..scripts import StageTimer, NullTimer
+from ..scripts import tokens_to_ids, pad_token_ids
+from collections import OrderedDict
 import os
+import threading
+import numpy as np
 
 
 class BidirectionalAttentionFlow():
 
     def __init__(self, emdim, max_passage_length=None, max_query_length=None, num_highway_layers=2, num_decoders=1,
-                 encoder_dropout=0, decoder_dropout=0):
+                 encoder_dropout=0, decoder_dropout=0, vocab=None, embedding_matrix=None,
+                 embedding_subset=None, output_logits=False, passage_cache_size=128):
         self.emdim = emdim
+        self.passage_cache_size = passage_cache_size
+        self.embedding_subset = embedding_subset
         self.max_passage_length = max_passage_length
         self.max_query_length = max_query_length
 
-        passage_input = Input(shape=(self.max_passage_length, emdim), dtype='float32', name="passage_input")
-        question_input = Input(shape=(self.max_query_length, emdim), dtype='float32', name="question_input")
+        # when a vocabulary is given, the model takes int32 token IDs and looks their vectors up in a frozen
+        # embedding matrix instead of taking precomputed vectors
+        self.vocab = vocab
+        if self.vocab is None:
+            passage_input = Input(shape=(self.max_passage_length, emdim), dtype='float32', name="passage_input")
+            question_input = Input(shape=(self.max_query_length, emdim), dtype='float32', name="question_input")
+
+            # padded positions hold zero vectors, masking them lets every layer below skip them
+            question_embedding = Masking(mask_value=0., name="question_mask")(question_input)
+            passage_embedding = Masking(mask_value=0., name="passage_mask")(passage_input)
+        else:
+            self.token_to_id = {token: i for i, token in enumerate(self.vocab)}
+
+            passage_input = Input(shape=(self.max_passage_length, ), dtype='int32', name="passage_input")
+            question_input = Input(shape=(self.max_query_length, ), dtype='int32', name="question_input")
+
+            embedding_weights = None if embedding_matrix is None else [embedding_matrix]
+            embedding_layer = Embedding(len(self.vocab), emdim, weights=embedding_weights, trainable=False,
+                                        mask_zero=True, name='word_embedding')
+            question_embedding = embedding_layer(question_input)
+            passage_embedding = embedding_layer(passage_input)
 
-        question_embedding = question_input
-        passage_embedding = passage_input
         for i in range(num_highway_layers):
             highway_layer = Highway(name='highway_{}'.format(i))
             question_layer = TimeDistributed(highway_layer, name=highway_layer.name + "_qtd")
@@ -50,8 +79,11 @@ class BidirectionalAttentionFlow():
                                               return_sequences=True), name='bidirectional_decoder_{}'.format(i))
             modeled_passage = hidden_layer(modeled_passage)
 
-        span_begin_probabilities = SpanBegin(name='span_begin')([merged_context, modeled_passage])
-        span_end_probabilities = SpanEnd(name='span_end')(
+        # with output_logits, the model outputs masked logits and the loss applies a fused log-softmax to them
+        self.output_logits = output_logits
+        span_begin_probabilities = SpanBegin(return_logits=output_logits, name='span_begin')(
+            [merged_context, modeled_passage])
+        span_end_probabilities = SpanEnd(return_logits=output_logits, name='span_end')(
             [encoded_passage, merged_context, modeled_passage, span_begin_probabilities])
 
         output = CombineOutputs(name='combine_outputs')([span_begin_probabilities, span_end_probabilities])
@@ -66,9 +98,14 @@ class BidirectionalAttentionFlow():
             pass
 
         adadelta = Adadelta(lr=0.01)
-        model.compile(loss=negative_avg_log_error, optimizer=adadelta, metrics=[accuracy])
+        loss, metric = self.get_loss_and_metric()
+        model.compile(loss=loss, optimizer=adadelta, metrics=[metric])
 
         self.model = model
+        self.span_decoders = {}
+        self.inference_models = None
+        self.passage_cache = OrderedDict()
+        self.passage_cache_lock = threading.Lock()
 
     def load_bidaf(self, path):
         custom_objects = {
@@ -81,14 +118,162 @@ class BidirectionalAttentionFlow():
             'SpanEnd': SpanEnd,
             'CombineOutputs': CombineOutputs,
             'negative_avg_log_error': negative_avg_log_error,
-            'accuracy': accuracy
+            'negative_avg_log_error_from_logits': negative_avg_log_error_from_logits,
+            'accuracy': accuracy,
+            'accuracy_from_logits': accuracy_from_logits
         }
 
         self.model = load_model(path, custom_objects=custom_objects)
+        self.span_decoders = {}
+        self.inference_models = None
+        self.passage_cache = OrderedDict()
+        self.passage_cache_lock = threading.Lock()
+
+        try:
+            self.output_logits = self.model.get_layer('span_begin').get_config().get('return_logits', False)
+        except ValueError:
+            self.output_logits = False
+
+    def get_loss_and_metric(self):
+        if self.output_logits:
+            return negative_avg_log_error_from_logits, accuracy_from_logits
+        return negative_avg_log_error, accuracy
+
+    def get_span_decoder(self, top_k, max_span_length, squad_version):
+        """Returns a model that runs BiDAF followed by an in-graph search of the top_k best non-overlapping spans"""
+        key = (top_k, max_span_length, squad_version)
+        if key not in self.span_decoders:
+            passage_length = Input(shape=(1, ), dtype='int32', name="passage_length")
+            top_spans = TopKSpans(top_k=top_k, max_span_length=max_span_length, squad_version=squad_version,
+                                  from_logits=self.output_logits,
+                                  name='top_k_spans')([self.model.outputs[0], passage_length])
+            self.span_decoders[key] = Model(self.model.inputs + [passage_length], [top_spans])
+        return self.span_decoders[key]
+
+    def get_inference_models(self):
+        """Splits the model into a passage encoder, a question encoder and a head which runs the attention, modeling
+        and output layers on encoded passages and questions. All three share their weights with the full model."""
+        if self.inference_models is None:
+            model = getattr(self.model, '_smodel', self.model)
+            layer_names = [layer.name for layer in model.layers]
+            uses_masks = 'passage_mask' in layer_names or 'word_embedding' in layer_names
+
+            def build_encoder(model_input, mask_layer_name, highway_suffix):
+                sequence_input = Input(batch_shape=K.int_shape(model_input), dtype=K.dtype(model_input))
+                encoded_sequence = sequence_input
+                for layer_name in ['word_embedding', mask_layer_name]:
+                    if layer_name in layer_names:
+                        encoded_sequence = model.get_layer(layer_name)(encoded_sequence)
+                i = 0
+                while 'highway_{}{}'.format(i, highway_suffix) in layer_names:
+                    encoded_sequence = model.get_layer('highway_{}{}'.format(i, highway_suffix))(encoded_sequence)
+                    i += 1
+                encoded_sequence = model.get_layer('bidirectional_encoder')(encoded_sequence)
+                return Model(sequence_input, encoded_sequence)
+
+            passage_encoder = build_encoder(model.inputs[0], 'passage_mask', '_ptd')
+            question_encoder = build_encoder(model.inputs[1], 'question_mask', '_qtd')
+
+            passage_length = K.int_shape(model.inputs[0])[1]
+            query_length = K.int_shape(model.inputs[1])[1]
+            encoding_dim = K.int_shape(passage_encoder.output)[-1]
+            encoded_passage = Input(shape=(passage_length, encoding_dim), name="encoded_passage")
+            encoded_question = Input(shape=(query_length, encoding_dim), name="encoded_question")
+            head_inputs = [encoded_passage, encoded_question]
+
+            if uses_masks:
+                passage_mask = Input(shape=(passage_length, ), name="passage_mask")
+                question_mask = Input(shape=(query_length, ), name="question_mask")
+                head_inputs += [passage_mask, question_mask]
+                encoded_passage = AttachMask()([encoded_passage, passage_mask])
+                encoded_question = AttachMask()([encoded_question, question_mask])
+
+            similarity_matrix = model.get_layer('similarity_layer')([encoded_passage, encoded_question])
+            context_to_query_attention = model.get_layer('context_to_query_attention')([
+                similarity_matrix, encoded_question])
+            query_to_context_attention = model.get_layer('query_to_context_attention')([
+                similarity_matrix, encoded_passage])
+            merged_context = model.get_layer('merged_context')(
+                [encoded_passage, context_to_query_attention, query_to_context_attention])
+
+            modeled_passage = merged_context
+            i = 0
+            while 'bidirectional_decoder_{}'.format(i) in layer_names:
+                modeled_passage = model.get_layer('bidirectional_decoder_{}'.format(i))(modeled_passage)
+                i += 1
+
+            span_begin_probabilities = model.get_layer('span_begin')([merged_context, modeled_passage])
+            span_end_probabilities = model.get_layer('span_end')(
+                [encoded_passage, merged_context, modeled_passage, span_begin_probabilities])
+            output = model.get_layer('combine_outputs')([span_begin_probabilities, span_end_probabilities])
+
+            head = Model(head_inputs, [output])
+            self.inference_models = (passage_encoder, question_encoder, head, uses_masks)
+        return self.inference_models
+
+    def run_head(self, encoded_passages, passage_lengths, encoded_questions, question_lengths):
+        """Returns the span begin and end probabilities of already encoded passages and questions"""
+        _, _, head, uses_masks = self.get_inference_models()
+
+        head_inputs = [encoded_passages, encoded_questions]
+        if uses_masks:
+            head_inputs += [sequence_mask(passage_lengths, encoded_passages.shape[1]),
+                            sequence_mask(question_lengths, encoded_questions.shape[1])]
+        y = head.predict(head_inputs, batch_size=len(encoded_passages))
+        if self.output_logits:
+            y = softmax(y)
+        return y
+
+    def get_passage_encodings(self, passages, do_lowercase=True, batch_size=32, tokenizer='nltk'):
+        """Returns the (passage, tokens, encoding, token offsets) of every passage. Passages missing from the passage
+        cache are encoded together in batches of batch_size and added to it."""
+        keys = [(passage.strip(), do_lowercase, tokenizer) for passage in passages]
+        # the server and prefetch threads share the cache, passages are encoded outside of the lock
+        with self.passage_cache_lock:
+            cached = {}
+            for key in keys:
+                if key in self.passage_cache:
+                    self.passage_cache.move_to_end(key)
+                    cached[key] = self.passage_cache[key]
+        missing = list(OrderedDict.fromkeys(key for key in keys if key not in cached))
+
+        encodings = {}
+        if missing:
+            passage_encoder = self.get_inference_models()[0]
+            tokenized = [tokenize_with_offsets(passage, do_lowercase, tokenizer) for passage, _, _ in missing]
+            contexts = [context_tokens for context_tokens, _ in tokenized]
+            for start in range(0, len(missing), batch_size):
+                batch_contexts = contexts[start:start + batch_size]
+                encoded_passages = passage_encoder.predict(self.embed_tokens(batch_contexts, self.max_passage_length),
+                                                           batch_size=len(batch_contexts))
+                for key, (context_tokens, token_offsets), encoded_passage in zip(missing[start:start + batch_size],
+                                                                                 tokenized[start:start + batch_size],
+                                                                                 encoded_passages):
+                    if self.max_passage_length is None:
+                        # drop the batch padding, the encoding gets padded again to fit the batch it is used in
+                        encoded_passage = encoded_passage[:len(context_tokens)]
+                    encodings[key] = (key[0], context_tokens, encoded_passage, token_offsets)
+
+        with self.passage_cache_lock:
+            self.passage_cache.update(encodings)
+            while len(self.passage_cache) > self.passage_cache_size:
+                self.passage_cache.popitem(last=False)
+        return [cached[key] if key in cached else encodings[key] for key in keys]
+
+    def get_passage_encoding(self, passage, do_lowercase=True, tokenizer='nltk'):
+        """Returns the (passage, tokens, encoding, token offsets) of a passage, encoding it only if it isn't in the
+        passage cache"""
+        return self.get_passage_encodings([passage], do_lowercase, tokenizer=tokenizer)[0]
 
     def train_model(self, train_generator, steps_per_epoch=None, epochs=1, validation_generator=None,
                     validation_steps=None, workers=1, use_multiprocessing=False, shuffle=True, initial_epoch=0,
-                    save_history=False, save_model_per_epoch=False):
+                    save_history=False, save_model_per_epoch=False, prefetch_depth=None, prefetch_threads=2,
+                    log_throughput=False, tensorboard_dir=None):
+        """Trains the model. With prefetch_depth set, batches are built that many steps ahead by prefetch_threads
+        background threads instead of Keras workers, and the number of steps the model had to wait for its data goes
+        to the history as prefetch_starved_batches along with the time spent waiting. log_throughput adds the
+        examples and tokens per second, step, data wait and compute times of every epoch and the peak memory of the
+        process so far to the history, and to the TensorBoard event files written to tensorboard_dir if it is given."""
 
         saved_items_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'saved_items')
         if not os.path.exists(saved_items_dir):
@@ -96,124 +281,385 @@ class BidirectionalAttentionFlow():
 
         callbacks = []
 
+        # must come before CSVLogger and TensorBoard which write the logs of the epoch
+        if log_throughput:
+            callbacks.append(ThroughputLogger(train_generator))
+
+        prefetchers = []
+        if prefetch_depth is not None:
+            # Keras doesn't shuffle the batches of workers=0, the prefetcher does
+            train_generator = Prefetcher(train_generator, depth=prefetch_depth, num_threads=prefetch_threads,
+                                         shuffle=shuffle)
+            prefetchers.append(train_generator)
+            # must come before CSVLogger which writes the logs of the epoch
+            callbacks.append(PrefetchStats(train_generator))
+            if validation_generator is not None:
+                validation_generator = Prefetcher(validation_generator, depth=prefetch_depth,
+                                                  num_threads=prefetch_threads)
+                prefetchers.append(validation_generator)
+            # the batches are read from the prefetching threads, Keras must not start workers of its own
+            workers = 0
+            use_multiprocessing = False
+
         if save_history:
             history_file = os.path.join(saved_items_dir, 'history')
             csv_logger = CSVLogger(history_file, append=True)
             callbacks.append(csv_logger)
 
+        if tensorboard_dir is not None:
+            callbacks.append(TensorBoard(log_dir=tensorboard_dir))
+
         if save_model_per_epoch:
             save_model_file = os.path.join(saved_items_dir, 'bidaf_{epoch:02d}.h5')
             checkpointer = ModelCheckpoint(filepath=save_model_file, verbose=1)
             callbacks.append(checkpointer)
 
-        history = self.model.fit_generator(train_generator, steps_per_epoch=steps_per_epoch, epochs=epochs,
-                                           callbacks=callbacks, validation_data=validation_generator,
-                                           validation_steps=validation_steps, workers=workers,
-                                           use_multiprocessing=use_multiprocessing, shuffle=shuffle,
-                                           initial_epoch=initial_epoch)
+        try:
+            history = self.model.fit_generator(train_generator, steps_per_epoch=steps_per_epoch, epochs=epochs,
+                                               callbacks=callbacks, validation_data=validation_generator,
+                                               validation_steps=validation_steps, workers=workers,
+                                               use_multiprocessing=use_multiprocessing, shuffle=shuffle,
+                                               initial_epoch=initial_epoch)
+        finally:
+            for prefetcher in prefetchers:
+                prefetcher.close()
         if not save_model_per_epoch:
             self.model.save(os.path.join(saved_items_dir, 'bidaf.h5'))
 
         return history, self.model
 
-    def predict_ans(self, passage, question, squad_version=1.1, max_span_length=25, do_lowercase=True,
-                    return_char_loc=False, return_confidence_score=False):
-
-        if type(passage) == list:
-            assert all(type(pas) == str for pas in passage), "Input 'passage' must be of type 'string'"
-
-            passage = [pas.strip() for pas in passage]
-            contexts = []
-            for pas in passage:
-                context_tokens = tokenize(pas, do_lowercase)
-                contexts.append(context_tokens)
+    def embed_tokens(self, token_lists, pad_to_length=None, timer=None):
+        timer = timer or NullTimer()
+        if self.vocab is None:
+            with timer.stage('load_vectors'):
+                vectors = MagnitudeVectors(self.emdim, subset_file=self.embedding_subset).load_vectors()
+            with timer.stage('embed'):
+                return vectors.query(token_lists, pad_to_length)
+        else:
+            with timer.stage('embed'):
+                return pad_token_ids([tokens_to_ids(tokens, self.token_to_id) for tokens in token_lists],
+                                     pad_to_length)
+
+    def embed_batch(self, contexts, questions, timer=None):
+        return self.embed_tokens(contexts, self.max_passage_length, timer), \
+            self.embed_tokens(questions, self.max_query_length, timer)
+
+    def decode_spans(self, contexts, questions, squad_version=1.1, max_span_length=25, top_k=None, inputs=None,
+                     timer=None):
+        """Runs the model on one batch of tokenized passages and questions and returns, for every sample, a list of
+        (start word, end word, confidence score) candidates: the best span, or the top_k best non-overlapping ones.
+        inputs may hold the batch already embedded by embed_batch. timer records the time of every stage of the batch
+        along with its size."""
+        timer = timer or NullTimer()
+        with timer.batch(batch_size=len(contexts)) as batch_info:
+            if inputs is None:
+                inputs = self.embed_batch(contexts, questions, timer)
+            context_batch, question_batch = inputs
+            batch_info["passage_length"] = context_batch.shape[1]
+            batch_info["query_length"] = question_batch.shape[1]
+
+            if top_k is None:
+                with timer.stage('model'):
+                    y = self.model.predict([context_batch, question_batch], batch_size=len(contexts))
+                    if self.output_logits:
+                        y = softmax(y)
+                y_pred_start = y[:, 0, :]
+                y_pred_end = y[:, 1, :]
+
+                # clearing the session releases memory by removing the model from memory
+                # using this, you will need to load model every time before prediction
+                # K.clear_session()
+
+                with timer.stage('span_search'):
+                    batch_answer_span, batch_confidence_score = get_best_span_batch(
+                        y_pred_start, y_pred_end, [len(context) for context in contexts], squad_version,
+                        max_span_length)
+                batch_candidates = [[(answer_span[0], answer_span[1], confidence_score)]
+                                    for answer_span, confidence_score in zip(batch_answer_span,
+                                                                             batch_confidence_score)]
+            else:
+                passage_lengths = np.array([[len(context)] for context in contexts], dtype='int32')
+                span_decoder = self.get_span_decoder(top_k, max_span_length, squad_version)
+                # the span search runs inside the graph, along with the model
+                with timer.stage('model'):
+                    y = span_decoder.predict([context_batch, question_batch, passage_lengths],
+                                             batch_size=len(contexts))
+
+                # the search returns empty spans with a score of 0 once every non-overlapping span is taken
+                batch_candidates = [[(int(start), int(end), confidence_score)
+                                     for start, end, confidence_score in top_spans if confidence_score > 0]
+                                    for top_spans in y]
+
+        return batch_candidates
+
+    def build_answers(self, passage, context_tokens, candidates, return_char_loc=False,
+                      return_confidence_score=False, token_offsets=None, do_lowercase=False):
+        """Cuts the answers of the (start, end, score) candidates out of the passage. token_offsets are character spans
+        in passage itself, which is why the answers are cut from it and only then lowercased with do_lowercase:
+        lowercasing can change the length of a string, e.g. 'İ'.lower() takes two characters."""
+        if token_offsets is None:
+            if do_lowercase:
+                passage = passage.lower()
+            # word index to character index mapping
+            mapping = get_word_char_loc_mapping(passage, context_tokens)
+            token_offsets = [(mapping[i], mapping[i] + len(token)) for i, token in enumerate(context_tokens)]
 
+        answers = []
+        for start, end, confidence_score in candidates:
+            char_loc_start = token_offsets[start][0]
+            # [1] => char_loc_end is set to point to one more character after the answer
+            char_loc_end = token_offsets[end][1]
+            # [1] will help us getting a perfect slice without unnecessary increments/decrements
+            ans = passage[char_loc_start:char_loc_end]
             if do_lowercase:
-                original_passage = [pas.lower() for pas in passage]
-            else:
-                original_passage = passage
+                ans = ans.lower()
 
-        elif type(passage) == str:
-            passage = passage.strip()
-            context_tokens = tokenize(passage, do_lowercase)
-            contexts = [context_tokens, ]
+            return_dict = {
+                "answer": ans,
+            }
 
-            if do_lowercase:
-                original_passage = [passage.lower(), ]
-            else:
-                original_passage = [passage, ]
+            if return_char_loc:
+                return_dict["char_loc_start"] = char_loc_start
+                return_dict["char_loc_end"] = char_loc_end - 1
 
-        else:
-            raise TypeError("Input 'passage' must be either a 'string' or 'list of strings'")
+            if return_confidence_score:
+                return_dict["confidence_score"] = confidence_score
 
-        assert type(passage) == type(
-            question), "Both 'passage' and 'question' must be either 'string' or a 'list of strings'"
+            answers.append(return_dict)
 
-        if type(question) == list:
-            assert all(type(ques) == str for ques in question), "Input 'question' must be of type 'string'"
-            assert len(passage) == len(
-                question), "Both lists (passage and question) must contain same number of elements"
+        return answers
 
-            questions = []
-            for ques in question:
-                question_tokens = tokenize(ques, do_lowercase)
-                questions.append(question_tokens)
+    def predict_ans(self, passage, question, squad_version=1.1, max_span_length=25, do_lowercase=True,
+                    return_char_loc=False, return_confidence_score=False, top_k=None, batch_size=32,
+                    window_size=None, window_stride=None, tokenizer='nltk', return_timings=False, metrics_sink=None):
+        """Predicts the answer of every (passage, question) pair. With window_size set, passages are read through
+        overlapping windows of window_size tokens, window_stride tokens apart (half a window by default), which are
+        batched together and whose answers are merged back into the whole passage. This bounds the memory and time of
+        a sample however long its passage is. A window_stride outside 1..window_size raises a ValueError. tokenizer
+        names the tokenizer of the inputs, 'nltk' or 'regex', whose character offsets locate the answers in the
+        passages.
+
+        With return_timings, the answers come along with a dict of the wall time of every stage (tokenize,
+        load_vectors, embed, model, span_search, build_answers), in total and per batch with the batch sizes. The same
+        dict is passed to metrics_sink, any callable such as a PrometheusSink, if one is given."""
+        if window_size is not None:
+            if window_stride is None:
+                window_stride = max(window_size // 2, 1)
+            check_window(window_size, window_stride)
+
+        timer = StageTimer() if return_timings or metrics_sink is not None else NullTimer()
+
+        with timer.stage('tokenize'):
+            if type(passage) == list:
+                assert all(type(pas) == str for pas in passage), "Input 'passage' must be of type 'string'"
+
+                passage = [pas.strip() for pas in passage]
+                contexts = []
+                context_offsets = []
+                for pas in passage:
+                    context_tokens, token_offsets = tokenize_with_offsets(pas, do_lowercase, tokenizer)
+                    contexts.append(context_tokens)
+                    context_offsets.append(token_offsets)
 
-        elif type(question) == str:
-            question_tokens = tokenize(question, do_lowercase)
-            questions = [question_tokens, ]
+                original_passage = passage
 
-        else:
-            raise TypeError("Input 'question' must be either a 'string' or 'list of strings'")
+            elif type(passage) == str:
+                passage = passage.strip()
+                context_tokens, token_offsets = tokenize_with_offsets(passage, do_lowercase, tokenizer)
+                contexts = [context_tokens, ]
+                context_offsets = [token_offsets, ]
 
-        vectors = MagnitudeVectors(self.emdim).load_vectors()
-        context_batch = vectors.query(contexts, self.max_passage_length)
-        question_batch = vectors.query(questions, self.max_query_length)
+                original_passage = [passage, ]
 
-        y = self.model.predict([context_batch, question_batch])
-        y_pred_start = y[:, 0, :]
-        y_pred_end = y[:, 1, :]
+            else:
+                raise TypeError("Input 'passage' must be either a 'string' or 'list of strings'")
 
-        # clearing the session releases memory by removing the model from memory
-        # using this, you will need to load model every time before prediction
-        # K.clear_session()
+            assert type(passage) == type(
+                question), "Both 'passage' and 'question' must be either 'string' or a 'list of strings'"
 
-        batch_answer_span = []
-        batch_confidence_score = []
-        for sample_id in range(len(contexts)):
-            answer_span, confidence_score = get_best_span(y_pred_start[sample_id, :], y_pred_end[sample_id, :],
-                                                          len(contexts[sample_id]), squad_version, max_span_length)
-            batch_answer_span.append(answer_span)
-            batch_confidence_score.append(confidence_score)
+            if type(question) == list:
+                assert all(type(ques) == str for ques in question), "Input 'question' must be of type 'string'"
+                assert len(passage) == len(
+                    question), "Both lists (passage and question) must contain same number of elements"
 
-        answers = []
-        for index, answer_span in enumerate(batch_answer_span):
-            context_tokens = contexts[index]
-            start, end = answer_span[0], answer_span[1]
+                questions = []
+                for ques in question:
+                    question_tokens = tokenize(ques, do_lowercase, tokenizer)
+                    questions.append(question_tokens)
 
-            # word index to character index mapping
-            mapping = get_word_char_loc_mapping(original_passage[index], context_tokens)
+            elif type(question) == str:
+                question_tokens = tokenize(question, do_lowercase, tokenizer)
+                questions = [question_tokens, ]
 
-            char_loc_start = mapping[start]
-            # [1] => char_loc_end is set to point to one more character after the answer
-            char_loc_end = mapping[end] + len(context_tokens[end])
-            # [1] will help us getting a perfect slice without unnecessary increments/decrements
-            ans = original_passage[index][char_loc_start:char_loc_end]
+            else:
+                raise TypeError("Input 'question' must be either a 'string' or 'list of strings'")
 
-            return_dict = {
-                "answer": ans,
-            }
+        # (sample, first token) of every window the model reads, a whole passage being a single window
+        if window_size is None:
+            windows = [(index, 0) for index in range(len(contexts))]
+            window_contexts = contexts
+        else:
+            windows = [(index, window_start) for index, context in enumerate(contexts)
+                       for window_start in get_window_starts(len(context), window_size, window_stride)]
+            window_contexts = [contexts[index][window_start:window_start + window_size]
+                               for index, window_start in windows]
+
+        # run the model on batches of passages of similar lengths, so that little of each batch is padding
+        if batch_size is None:
+            batch_size = len(windows)
+        window_candidates = [None] * len(windows)
+        order = np.argsort([len(context) for context in window_contexts], kind='stable')
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            candidates = self.decode_spans([window_contexts[i] for i in batch_indices],
+                                           [questions[windows[i][0]] for i in batch_indices],
+                                           squad_version, max_span_length, top_k, timer=timer)
+            for index, sample_candidates in zip(batch_indices, candidates):
+                window_candidates[index] = sample_candidates
+
+        if window_size is None:
+            batch_candidates = window_candidates
+        else:
+            passage_candidates = [[] for _ in contexts]
+            for (index, window_start), candidates in zip(windows, window_candidates):
+                for start, end, confidence_score in candidates:
+                    if squad_version == 2.0 and start == 0 and end == 0 and window_start > 0:
+                        # the null span of a window is its first word, only the first window can map it to the
+                        # null span of the passage
+                        continue
+                    passage_candidates[index].append((start + window_start, end + window_start, confidence_score))
+            batch_candidates = [merge_window_candidates(candidates, top_k or 1) for candidates in passage_candidates]
 
-            if return_char_loc:
-                return_dict["char_loc_start"] = char_loc_start
-                return_dict["char_loc_end"] = char_loc_end - 1
+        answers = []
+        with timer.stage('build_answers'):
+            for index, candidates in enumerate(batch_candidates):
+                sample_answers = self.build_answers(original_passage[index], contexts[index], candidates,
+                                                    return_char_loc, return_confidence_score, context_offsets[index],
+                                                    do_lowercase)
+                answers.append(sample_answers if top_k is not None else sample_answers[0])
+
+        if type(passage) != list:
+            answers = answers[0]
+
+        if return_timings or metrics_sink is not None:
+            timings = timer.as_dict()
+            if metrics_sink is not None:
+                metrics_sink(timings)
+            if return_timings:
+                return answers, timings
+        return answers
+
+    def predict_ans_for_passage(self, passage, question, squad_version=1.1, max_span_length=25, do_lowercase=True,
+                                return_char_loc=False, return_confidence_score=False, batch_size=32, tokenizer='nltk'):
+        """Answers one or many questions about a single passage. The passage is encoded once and its encoding is
+        cached, so later questions about it only run the question encoder and the attention and modeling layers."""
+
+        if type(passage) != str:
+            raise TypeError("Input 'passage' must be a 'string'")
 
-            if return_confidence_score:
-                return_dict["confidence_score"] = batch_confidence_score[index]
+        if type(question) == list:
+            assert all(type(ques) == str for ques in question), "Input 'question' must be of type 'string'"
+            questions = [tokenize(ques, do_lowercase, tokenizer) for ques in question]
+        elif type(question) == str:
+            questions = [tokenize(question, do_lowercase, tokenizer), ]
+        else:
+            raise TypeError("Input 'question' must be either a 'string' or 'list of strings'")
 
-            answers.append(return_dict)
+        original_passage, context_tokens, encoded_passage, token_offsets = self.get_passage_encoding(
+            passage, do_lowercase, tokenizer)
+        question_encoder = self.get_inference_models()[1]
 
-        if type(passage) == list:
+        answers = []
+        for start in range(0, len(questions), batch_size):
+            batch_questions = questions[start:start + batch_size]
+            encoded_questions = question_encoder.predict(self.embed_tokens(batch_questions, self.max_query_length),
+                                                         batch_size=len(batch_questions))
+            encoded_passages = np.repeat(encoded_passage[np.newaxis], len(batch_questions), axis=0)
+            passage_lengths = [len(context_tokens)] * len(batch_questions)
+
+            y = self.run_head(encoded_passages, passage_lengths, encoded_questions,
+                              [len(question_tokens) for question_tokens in batch_questions])
+            batch_answer_span, batch_confidence_score = get_best_span_batch(
+                y[:, 0, :], y[:, 1, :], passage_lengths, squad_version, max_span_length)
+
+            for answer_span, confidence_score in zip(batch_answer_span, batch_confidence_score):
+                answers += self.build_answers(original_passage, context_tokens,
+                                              [(answer_span[0], answer_span[1], confidence_score)],
+                                              return_char_loc, return_confidence_score, token_offsets, do_lowercase)
+
+        if type(question) == list:
             return answers
         else:
             return answers[0]
+
+    def predict_ans_multi(self, question, passages, squad_version=1.1, max_span_length=25, do_lowercase=True,
+                          return_char_loc=False, return_confidence_score=False, batch_size=32, tokenizer='nltk'):
+        """Answers a single question from a list of candidate passages. The question is encoded once and broadcast over
+        batches of passages. Returns the best answer across the passages, along with the index of the passage it was
+        found in and the confidence score of the best answer of every passage."""
+
+        if type(question) != str:
+            raise TypeError("Input 'question' must be a 'string'")
+
+        if type(passages) != list or len(passages) == 0:
+            raise TypeError("Input 'passages' must be a non-empty 'list of strings'")
+        assert all(type(pas) == str for pas in passages), "Input 'passages' must be of type 'string'"
+
+        question_tokens = tokenize(question, do_lowercase, tokenizer)
+        question_encoder = self.get_inference_models()[1]
+        encoded_question = question_encoder.predict(self.embed_tokens([question_tokens, ], self.max_query_length))[0]
+
+        encodings = self.get_passage_encodings(passages, do_lowercase, batch_size, tokenizer)
+
+        passage_spans = [None] * len(passages)
+        passage_scores = np.zeros(len(passages), dtype='float32')
+        order = np.argsort([len(encoding[1]) for encoding in encodings], kind='stable')
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch_encodings = [encodings[i][2] for i in batch_indices]
+            passage_lengths = [len(encodings[i][1]) for i in batch_indices]
+
+            encoded_passages = np.zeros((len(batch_indices), max(len(encoding) for encoding in batch_encodings),
+                                         encoded_question.shape[-1]), dtype='float32')
+            for i, encoding in enumerate(batch_encodings):
+                encoded_passages[i, :len(encoding)] = encoding
+            encoded_questions = np.repeat(encoded_question[np.newaxis], len(batch_indices), axis=0)
+
+            y = self.run_head(encoded_passages, passage_lengths, encoded_questions,
+                              [len(question_tokens)] * len(batch_indices))
+            batch_answer_span, batch_confidence_score = get_best_span_batch(
+                y[:, 0, :], y[:, 1, :], passage_lengths, squad_version, max_span_length)
+            for index, answer_span, confidence_score in zip(batch_indices, batch_answer_span,
+                                                            batch_confidence_score):
+                passage_spans[index] = answer_span
+                passage_scores[index] = confidence_score
+
+        best_index = int(np.argmax(passage_scores))
+        original_passage, context_tokens, _, token_offsets = encodings[best_index]
+        answer_span = passage_spans[best_index]
+        return_dict = self.build_answers(original_passage, context_tokens,
+                                         [(answer_span[0], answer_span[1], passage_scores[best_index])],
+                                         return_char_loc, return_confidence_score, token_offsets,
+                                         do_lowercase)[0]
+        return_dict["passage_index"] = best_index
+        return_dict["passage_scores"] = passage_scores.tolist()
+        return return_dict
+
+    def predict_ans_from_index(self, question, index, num_paragraphs=5, squad_version=1.1, max_span_length=25,
+                               do_lowercase=True, return_char_loc=False, return_confidence_score=False, batch_size=32,
+                               tokenizer='nltk'):
+        """Answers a question from a whole corpus: the num_paragraphs paragraphs of the BM25Index best matching the
+        question are retrieved and only those are read by the model"""
+        retrieved = index.search(question, num_paragraphs)
+        if not retrieved:
+            return None
+
+        paragraph_ids = [paragraph_id for paragraph_id, _ in retrieved]
+        answer = self.predict_ans_multi(question, index.get_paragraphs(paragraph_ids), squad_version=squad_version,
+                                        max_span_length=max_span_length, do_lowercase=do_lowercase,
+                                        return_char_loc=return_char_loc,
+                                        return_confidence_score=return_confidence_score, batch_size=batch_size,
+                                        tokenizer=tokenizer)
+        answer["paragraph_id"] = paragraph_ids[answer["passage_index"]]
+        answer["retrieval_scores"] = [retrieval_score for _, retrieval_score in retrieved]
+        return answer
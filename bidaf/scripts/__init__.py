@@ -1,8 +1,20 @@
 from .batch_generator import BatchGenerator
-from .loss_function import negative_avg_log_error
+from .bucket_sampler import BucketSampler
+from .prefetcher import Prefetcher, PrefetchStats
+from .throughput_logger import ThroughputLogger
+from .compiled_dataset import compile_squad_dataset, CompiledDataset, tokens_to_ids, pad_token_ids
+from .loss_function import negative_avg_log_error, negative_avg_log_error_from_logits
 from .magnitude import MagnitudeVectors
+from .embedding_matrix import build_embedding_matrix, load_embedding_matrix, build_embedding_subset, \
+    build_squad_embedding_subset
 from .data_generator import load_data_generators
-from .accuracy_metric import accuracy
+from .accuracy_metric import accuracy, accuracy_from_logits
 from .multi_gpu_model import ModelMGPU
-from .preprocess import data_download_and_preprocess, tokenize
-from .postprocess import get_best_span, get_word_char_loc_mapping
+from .tokenizers import NltkTokenizer, RegexTokenizer, get_tokenizer, compare_tokenizers
+from .preprocess import data_download_and_preprocess, tokenize, tokenize_with_offsets, iter_json_array
+from .file_prediction import predict_file
+from .stage_timer import StageTimer, NullTimer, PrometheusSink
+from .inference_server import serve
+from .bm25_index import BM25Index, build_bm25_index
+from .postprocess import get_best_span, get_best_span_batch, get_word_char_loc_mapping, softmax, sequence_mask, \
+    get_window_starts, merge_window_candidates, check_window
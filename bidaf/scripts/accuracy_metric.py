@@ -1,17 +1,22 @@
 from keras import backend as K
 
 
-def accuracy(y_true, y_pred):
+def accuracy(y_true, y_pred, from_logits=False):
 
-    def calculate_accuracy(true_and_pred):
-        y_true, y_pred_start, y_pred_end = true_and_pred
+    def probabilities_of(y_true, y_pred):
+        # picks y_pred[i, y_true[i]] for every sample i of the batch at once
+        true_positions = K.one_hot(y_true, K.shape(y_pred)[-1])
+        return K.sum(true_positions * y_pred, axis=-1)
 
-        start_probability = y_pred_start[K.cast(y_true[0], dtype='int32')]
-        end_probability = y_pred_end[K.cast(y_true[1], dtype='int32')]
-        return (start_probability + end_probability) / 2.0
+    if from_logits:
+        y_pred = K.softmax(y_pred, axis=-1)
 
-    y_true = K.squeeze(y_true, axis=1)
+    y_true = K.cast(K.squeeze(y_true, axis=1), dtype='int32')
     y_pred_start = y_pred[:, 0, :]
     y_pred_end = y_pred[:, 1, :]
-    accuracy = K.map_fn(calculate_accuracy, (y_true, y_pred_start, y_pred_end), dtype='float32')
+    accuracy = (probabilities_of(y_true[:, 0], y_pred_start) + probabilities_of(y_true[:, 1], y_pred_end)) / 2.0
     return K.mean(accuracy, axis=0)
+
+
+def accuracy_from_logits(y_true, y_pred):
+    return accuracy(y_true, y_pred, from_logits=True)
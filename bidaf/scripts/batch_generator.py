@@ -1,7 +1,11 @@
 from keras.utils import Sequence
 import os
+import threading
 import numpy as np
 from .magnitude import MagnitudeVectors
+from .line_index import load_line_index, load_line_lengths, read_lines
+from .bucket_sampler import BucketSampler
+from .compiled_dataset import compile_squad_dataset, CompiledDataset, pad_token_ids
 
 
 class BatchGenerator(Sequence):
@@ -9,12 +13,20 @@ class BatchGenerator(Sequence):
 
     vectors = None
 
-    def __init__(self, gen_type, batch_size, emdim, squad_version, max_passage_length, max_query_length, shuffle):
+    def __init__(self, gen_type, batch_size, emdim, squad_version, max_passage_length, max_query_length, shuffle,
+                 use_compiled_dataset=False, return_token_ids=False, embedding_subset=None, bucket_boundaries=None):
         'Initialization'
 
         base_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'data')
 
-        self.vectors = MagnitudeVectors(emdim).load_vectors()
+        # token IDs can only be served from the compiled dataset whose vocabulary they refer to
+        self.return_token_ids = return_token_ids
+        if self.return_token_ids:
+            use_compiled_dataset = True
+        else:
+            # the vectors themselves are looked up per batch, so that every worker process uses its own store
+            self.vectors = MagnitudeVectors(emdim, subset_file=embedding_subset)
+
         self.squad_version = squad_version
 
         self.max_passage_length = max_passage_length
@@ -28,15 +40,43 @@ class BatchGenerator(Sequence):
                                                    '-v{}.is_impossible'.format(squad_version))
 
         self.batch_size = batch_size
-        i = 0
-        with open(self.span_file, 'r', encoding='utf-8') as f:
 
-            for i, _ in enumerate(f):
-                pass
-        self.num_of_batches = (i + 1) // self.batch_size
-        self.indices = np.arange(i + 1)
+        self.use_compiled_dataset = use_compiled_dataset
+        if self.use_compiled_dataset:
+            compile_squad_dataset(squad_version)
+            self.dataset = CompiledDataset(gen_type, squad_version)
+            num_of_samples = len(self.dataset)
+        else:
+            self.context_index = load_line_index(self.context_file)
+            self.question_index = load_line_index(self.question_file)
+            self.span_index = load_line_index(self.span_file)
+            if self.squad_version == 2.0:
+                self.is_impossible_index = load_line_index(self.is_impossible_file)
+            num_of_samples = len(self.span_index) - 1
+
+        # examples and non-padding tokens served so far, read by ThroughputLogger. Batches built in worker processes
+        # are only counted there. A Prefetcher building batches ahead counts them once it hands them over instead,
+        # through mark_served, so that batches which are never read don't count.
+        self.num_examples_served = 0
+        self.num_tokens_served = 0
+        self.count_on_read = True
+        self.unserved_batches = {}
+        self.counter_lock = threading.Lock()
+
+        self.num_of_batches = num_of_samples // self.batch_size
+        self.indices = np.arange(num_of_samples)
         self.shuffle = shuffle
 
+        # batches of passages of similar lengths waste less of the model's time on padding
+        self.sampler = None
+        if bucket_boundaries is not None:
+            if self.use_compiled_dataset:
+                passage_lengths = self.dataset.context_lengths()
+            else:
+                passage_lengths = load_line_lengths(self.context_file)
+            self.sampler = BucketSampler(passage_lengths, self.batch_size, bucket_boundaries, self.shuffle)
+            self.num_of_batches = len(self.sampler)
+
     def __len__(self):
         'Denotes the number of batches per epoch'
         return self.num_of_batches
@@ -44,56 +84,81 @@ class BatchGenerator(Sequence):
     def __getitem__(self, index):
         'Generate one batch of data'
         # Generate indexes of the batch
-        start_index = (index * self.batch_size) + 1
-        end_index = ((index + 1) * self.batch_size) + 1
-
-        inds = self.indices[start_index:end_index]
-
-        contexts = []
-        with open(self.context_file, 'r', encoding='utf-8') as cf:
-            for i, line in enumerate(cf, start=1):
-                line = line[:-1]
-                if i in inds:
-                    contexts.append(line.split(' '))
-
-        questions = []
-        with open(self.question_file, 'r', encoding='utf-8') as qf:
-            for i, line in enumerate(qf, start=1):
-                line = line[:-1]
-                if i in inds:
-                    questions.append(line.split(' '))
-
-        answer_spans = []
-        with open(self.span_file, 'r', encoding='utf-8') as sf:
-            for i, line in enumerate(sf, start=1):
-                line = line[:-1]
-                if i in inds:
-                    answer_spans.append(line.split(' '))
+        if self.sampler is not None:
+            inds = self.sampler.batches[index]
+        else:
+            inds = self.indices[index * self.batch_size:(index + 1) * self.batch_size]
+
+        if self.return_token_ids:
+            contexts = self.dataset.get_contexts(inds)
+            questions = self.dataset.get_questions(inds)
+            answer_spans = self.dataset.spans[inds].tolist()
+            if self.squad_version == 2.0:
+                unanswerable_id = self.dataset.vocab.index("unanswerable")
+                is_impossible = self.dataset.is_impossible[inds].tolist()
+                contexts = [np.concatenate([[unanswerable_id], context]) for context in contexts]
+                answer_spans = [[0, 0] if flag == 1 else [start + 1, end + 1]
+                                for flag, (start, end) in zip(is_impossible, answer_spans)]
+
+            num_tokens = sum(len(context) for context in contexts) + sum(len(question) for question in questions)
+            context_batch = pad_token_ids(contexts, pad_to_length=self.max_passage_length)
+            question_batch = pad_token_ids(questions, pad_to_length=self.max_query_length)
+        else:
+            contexts, questions, answer_spans, is_impossible = self._read_batch(inds)
+
+            if self.squad_version == 2.0:
+                for i, flag in enumerate(is_impossible):
+                    contexts[i].insert(0, "unanswerable")
+                    if flag == 1:
+                        answer_spans[i] = [0, 0]
+                    else:
+                        answer_spans[i] = [int(val) + 1 for val in answer_spans[i]]
+
+            num_tokens = sum(len(context) for context in contexts) + sum(len(question) for question in questions)
+            vectors = self.vectors.load_vectors()
+            context_batch = vectors.query(contexts, pad_to_length=self.max_passage_length)
+            question_batch = vectors.query(questions, pad_to_length=self.max_query_length)
 
-        if self.squad_version == 2.0:
-            is_impossible = []
-            with open(self.is_impossible_file, 'r', encoding='utf-8') as isimpf:
-                for i, line in enumerate(isimpf, start=1):
-                    line = line[:-1]
-                    if i in inds:
-                        is_impossible.append(line)
-
-            for i, flag in enumerate(is_impossible):
-                contexts[i].insert(0, "unanswerable")
-                if flag == "1":
-                    answer_spans[i] = [0, 0]
-                else:
-                    answer_spans[i] = [int(val) + 1 for val in answer_spans[i]]
-
-        context_batch = self.vectors.query(contexts, pad_to_length=self.max_passage_length)
-        question_batch = self.vectors.query(questions, pad_to_length=self.max_query_length)
         if self.max_passage_length is not None:
             span_batch = np.expand_dims(np.array(answer_spans, dtype='float32'), axis=1).clip(0,
                                                                                               self.max_passage_length - 1)
         else:
             span_batch = np.expand_dims(np.array(answer_spans, dtype='float32'), axis=1)
+
+        with self.counter_lock:
+            self.unserved_batches[index] = (len(inds), num_tokens)
+        if self.count_on_read:
+            self.mark_served(index)
+
         return [context_batch, question_batch], [span_batch]
 
+    def mark_served(self, index):
+        with self.counter_lock:
+            num_examples, num_tokens = self.unserved_batches.pop(index, (0, 0))
+            self.num_examples_served += num_examples
+            self.num_tokens_served += num_tokens
+
+    def _read_batch(self, inds):
+        is_impossible = None
+
+        if self.use_compiled_dataset:
+            contexts = [self.dataset.to_tokens(ids) for ids in self.dataset.get_contexts(inds)]
+            questions = [self.dataset.to_tokens(ids) for ids in self.dataset.get_questions(inds)]
+            answer_spans = self.dataset.spans[inds].tolist()
+            if self.squad_version == 2.0:
+                is_impossible = self.dataset.is_impossible[inds].tolist()
+        else:
+            contexts = [line.split(' ') for line in read_lines(self.context_file, self.context_index, inds)]
+            questions = [line.split(' ') for line in read_lines(self.question_file, self.question_index, inds)]
+            answer_spans = [line.split(' ') for line in read_lines(self.span_file, self.span_index, inds)]
+            if self.squad_version == 2.0:
+                is_impossible = [int(flag) for flag in
+                                 read_lines(self.is_impossible_file, self.is_impossible_index, inds)]
+
+        return contexts, questions, answer_spans, is_impossible
+
     def on_epoch_end(self):
-        if self.shuffle:
+        if self.sampler is not None:
+            self.sampler.on_epoch_end()
+        elif self.shuffle:
             np.random.shuffle(self.indices)
@@ -0,0 +1,197 @@
+import os
+import json
+from collections import Counter
+import numpy as np
+from .preprocess import tokenize
+from .line_index import load_line_index, read_lines
+from .compiled_dataset import read_vocab, write_vocab
+
+
+class BM25Index():
+    """On-disk inverted index of paragraphs, searched with BM25.
+
+    Paragraphs are added in batches and written out as immutable segments, so an index grows incrementally without
+    rewriting what is already on disk. Every segment holds its sorted terms, the offsets of their postings and the
+    postings themselves (paragraph IDs and term frequencies) as .npy files which are memory-mapped at search time.
+    Only the term dictionaries are kept in memory. The paragraphs themselves are appended to paragraphs.txt, one per
+    line, and read back through a line index. The metadata records how much of paragraphs.txt belongs to the index, so
+    lines left over by an interrupted flush are cut off before the next one.
+
+    An index that doesn't exist yet is only created with create=True, otherwise opening it raises FileNotFoundError.
+    do_lowercase and tokenizer are stored with a new index, and questions are always tokenized with those.
+    """
+
+    def __init__(self, index_dir, k1=1.2, b=0.75, segment_size=100000, do_lowercase=True, tokenizer='nltk',
+                 create=False):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.segment_size = segment_size
+
+        self.meta_file = os.path.join(index_dir, 'meta.json')
+        self.paragraphs_file = os.path.join(index_dir, 'paragraphs.txt')
+
+        if os.path.isfile(self.meta_file):
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+            if "paragraphs_size" not in self.meta:
+                self.meta["paragraphs_size"] = os.path.getsize(self.paragraphs_file) \
+                    if os.path.isfile(self.paragraphs_file) else 0
+        elif create:
+            if not os.path.exists(index_dir):
+                os.makedirs(index_dir)
+            self.meta = {"num_paragraphs": 0, "total_length": 0, "paragraphs_size": 0, "do_lowercase": do_lowercase,
+                         "tokenizer": tokenizer, "segments": []}
+        else:
+            raise FileNotFoundError("No BM25 index found in '{}'".format(index_dir))
+        # questions must be tokenized the way the paragraphs were
+        self.do_lowercase = self.meta["do_lowercase"]
+        self.tokenizer = self.meta.get("tokenizer", 'nltk')
+
+        self.segments = [self.open_segment(segment) for segment in self.meta["segments"]]
+        self.paragraph_offsets = None
+        self.pending_paragraphs = []
+
+    def __len__(self):
+        return self.meta["num_paragraphs"]
+
+    def get_segment_file(self, name, suffix):
+        return os.path.join(self.index_dir, name + '.' + suffix)
+
+    def open_segment(self, segment):
+        name = segment["name"]
+        terms = read_vocab(self.get_segment_file(name, 'terms'))
+        return {
+            "first_paragraph": segment["first_paragraph"],
+            "term_to_id": {term: i for i, term in enumerate(terms)},
+            "offsets": np.load(self.get_segment_file(name, 'offsets.npy'), mmap_mode='r'),
+            "paragraph_ids": np.load(self.get_segment_file(name, 'paragraphs.npy'), mmap_mode='r'),
+            "term_frequencies": np.load(self.get_segment_file(name, 'frequencies.npy'), mmap_mode='r'),
+            "lengths": np.load(self.get_segment_file(name, 'lengths.npy'), mmap_mode='r'),
+        }
+
+    def tokenize(self, text):
+        # punctuation only tokens carry no signal for retrieval
+        return [token for token in tokenize(text, self.do_lowercase, self.tokenizer)
+                if any(char.isalnum() for char in token)]
+
+    def add_paragraphs(self, paragraphs):
+        """Adds paragraphs to the index, a new segment is written every segment_size paragraphs"""
+        for paragraph in paragraphs:
+            # a paragraph takes exactly one line of the paragraphs file
+            self.pending_paragraphs.append(' '.join(paragraph.split()))
+            if len(self.pending_paragraphs) >= self.segment_size:
+                self.flush()
+
+    def flush(self):
+        """Writes the pending paragraphs out as a new segment"""
+        if not self.pending_paragraphs:
+            return
+
+        postings = {}
+        lengths = np.zeros(len(self.pending_paragraphs), dtype='int32')
+        for paragraph_id, paragraph in enumerate(self.pending_paragraphs):
+            tokens = self.tokenize(paragraph)
+            lengths[paragraph_id] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                postings.setdefault(term, []).append((paragraph_id, frequency))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        paragraph_ids = np.zeros(offsets[-1], dtype='int32')
+        term_frequencies = np.zeros(offsets[-1], dtype='int32')
+        for i, term in enumerate(terms):
+            term_postings = np.array(postings[term], dtype='int32')
+            paragraph_ids[offsets[i]:offsets[i + 1]] = term_postings[:, 0]
+            term_frequencies[offsets[i]:offsets[i + 1]] = term_postings[:, 1]
+
+        name = 'segment-{:05d}'.format(len(self.meta["segments"]))
+        write_vocab(self.get_segment_file(name, 'terms'), terms)
+        np.save(self.get_segment_file(name, 'offsets.npy'), offsets)
+        np.save(self.get_segment_file(name, 'paragraphs.npy'), paragraph_ids)
+        np.save(self.get_segment_file(name, 'frequencies.npy'), term_frequencies)
+        np.save(self.get_segment_file(name, 'lengths.npy'), lengths)
+
+        with open(self.paragraphs_file, 'ab') as f:
+            # drop the paragraphs of a flush which never made it into the metadata, they would shift every ID after them
+            f.truncate(self.meta["paragraphs_size"])
+            f.seek(self.meta["paragraphs_size"])
+            for paragraph in self.pending_paragraphs:
+                f.write((paragraph + '\n').encode('utf-8'))
+            paragraphs_size = f.tell()
+
+        segment = {"name": name, "first_paragraph": self.meta["num_paragraphs"],
+                   "num_paragraphs": len(self.pending_paragraphs)}
+        self.meta["segments"].append(segment)
+        self.meta["num_paragraphs"] += len(self.pending_paragraphs)
+        self.meta["total_length"] += int(lengths.sum())
+        self.meta["paragraphs_size"] = paragraphs_size
+
+        # the segment only becomes part of the index once the metadata pointing to it is in place
+        meta_file = self.meta_file + '.tmp'
+        with open(meta_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(meta_file, self.meta_file)
+
+        self.segments.append(self.open_segment(segment))
+        self.paragraph_offsets = None
+        self.pending_paragraphs = []
+
+    def search(self, question, top_k=10):
+        """Returns the (paragraph ID, BM25 score) of the top_k paragraphs best matching the question, best first"""
+        num_paragraphs = len(self)
+        if num_paragraphs == 0:
+            return []
+        average_length = self.meta["total_length"] / num_paragraphs
+
+        query_terms = Counter(self.tokenize(question))
+        postings = []
+        document_frequencies = Counter()
+        for segment in self.segments:
+            for term in query_terms:
+                term_id = segment["term_to_id"].get(term)
+                if term_id is not None:
+                    postings.append((term, segment, segment["offsets"][term_id], segment["offsets"][term_id + 1]))
+                    document_frequencies[term] += int(segment["offsets"][term_id + 1] - segment["offsets"][term_id])
+
+        # only the paragraphs holding a query term get a score
+        hit_ids = []
+        hit_scores = []
+        for term, segment, start, end in postings:
+            document_frequency = document_frequencies[term]
+            idf = np.log(1.0 + (num_paragraphs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+            paragraph_ids = np.asarray(segment["paragraph_ids"][start:end])
+            term_frequencies = np.asarray(segment["term_frequencies"][start:end], dtype='float32')
+            lengths = np.asarray(segment["lengths"][paragraph_ids], dtype='float32')
+            term_scores = idf * term_frequencies * (self.k1 + 1) / \
+                (term_frequencies + self.k1 * (1 - self.b + self.b * lengths / average_length))
+            hit_ids.append(segment["first_paragraph"] + paragraph_ids.astype('int64'))
+            hit_scores.append(query_terms[term] * term_scores)
+        if not hit_ids:
+            return []
+
+        matching, hits = np.unique(np.concatenate(hit_ids), return_inverse=True)
+        scores = np.bincount(hits, weights=np.concatenate(hit_scores)).astype('float32')
+        best = np.arange(len(matching))
+        if len(best) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(matching[i]), float(scores[i])) for i in best]
+
+    def get_paragraphs(self, paragraph_ids):
+        if self.paragraph_offsets is None:
+            self.paragraph_offsets = load_line_index(self.paragraphs_file)
+        return read_lines(self.paragraphs_file, self.paragraph_offsets, paragraph_ids)
+
+
+def build_bm25_index(corpus_files, index_dir, do_lowercase=True, segment_size=100000, tokenizer='nltk'):
+    """Adds the paragraphs of the given files, one paragraph per line, to the index in index_dir"""
+    index = BM25Index(index_dir, segment_size=segment_size, do_lowercase=do_lowercase, tokenizer=tokenizer,
+                      create=True)
+    for corpus_file in corpus_files:
+        with open(corpus_file, 'r', encoding='utf-8') as f:
+            index.add_paragraphs(line for line in f if line.strip())
+    index.flush()
+    return index
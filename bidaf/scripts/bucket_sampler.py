@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class BucketSampler():
+    """Groups examples into batches of examples of similar lengths.
+
+    bucket_boundaries are the passage lengths at which a new bucket starts, e.g. [100, 200] makes the buckets
+    [0, 100), [100, 200) and [200, inf). Batches never mix buckets, so the last batch of every bucket holds what is left
+    of it and may be smaller than batch_size. When shuffle is set, examples are shuffled within their buckets and
+    batches across buckets, each epoch.
+    """
+
+    def __init__(self, lengths, batch_size, bucket_boundaries, shuffle=False):
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+        bucket_ids = np.digitize(lengths, sorted(bucket_boundaries))
+        self.buckets = [np.flatnonzero(bucket_ids == bucket_id) for bucket_id in range(len(bucket_boundaries) + 1)]
+        self.batches = self.make_batches()
+
+    def __len__(self):
+        return len(self.batches)
+
+    def make_batches(self):
+        batches = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = np.random.permutation(bucket)
+            for start in range(0, len(bucket), self.batch_size):
+                batches.append(bucket[start:start + self.batch_size])
+
+        if self.shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        return batches
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.batches = self.make_batches()
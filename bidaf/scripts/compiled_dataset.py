@@ -0,0 +1,156 @@
+"""Compiles the tokenized SQuAD text files into flat, memory-mappable arrays of token IDs"""
+
+import os
+from array import array
+import numpy as np
+
+PAD_TOKEN = '<pad>'
+UNK_TOKEN = '<unk>'
+
+base_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'squad')
+
+
+def get_vocab_file(squad_version, data_dir=base_dir):
+    return os.path.join(data_dir, 'squad-v{}.vocab'.format(squad_version))
+
+
+def get_compiled_dir(tier, squad_version, data_dir=base_dir):
+    return os.path.join(data_dir, tier + '-v{}.compiled'.format(squad_version))
+
+
+def read_vocab(vocab_file):
+    """Reads the vocabulary written by compile_squad_dataset, one token per line, the line number being its ID"""
+    with open(vocab_file, 'rb') as f:
+        return f.read().decode('utf-8').split('\n')[:-1]
+
+
+def write_vocab(vocab_file, vocab):
+    with open(vocab_file, 'wb') as f:
+        for token in vocab:
+            f.write((token + '\n').encode('utf-8'))
+
+
+def _encode_lines(text_file, token_to_id, vocab):
+    ids = array('i')
+    offsets = array('q', [0])
+    with open(text_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            for token in line[:-1].split(' '):
+                token_id = token_to_id.get(token)
+                if token_id is None:
+                    token_id = token_to_id[token] = len(vocab)
+                    vocab.append(token)
+                ids.append(token_id)
+            offsets.append(len(ids))
+    return np.frombuffer(ids, dtype='int32'), np.frombuffer(offsets, dtype='int64')
+
+
+def _is_up_to_date(compiled_dir, text_files):
+    marker = os.path.join(compiled_dir, 'spans.npy')
+    if not os.path.isfile(marker):
+        return False
+    return all(os.path.getmtime(marker) >= os.path.getmtime(text_file) for text_file in text_files)
+
+
+def compile_squad_dataset(squad_version=1.1, tiers=('train', 'dev'), data_dir=base_dir, force=False):
+    """Converts the {tier}-v{version}.{context/question/span/is_impossible} text files into compiled datasets.
+
+    All tiers share a single vocabulary so that the same token always gets the same ID. IDs 0 and 1 are reserved for
+    padding and unknown tokens. Nothing is rewritten if every compiled tier is newer than its text files.
+    """
+
+    suffixes = ['context', 'question', 'span']
+    if squad_version == 2.0:
+        suffixes.append('is_impossible')
+
+    text_files = {tier: [os.path.join(data_dir, tier + '-v{}.{}'.format(squad_version, suffix)) for suffix in suffixes]
+                  for tier in tiers}
+
+    vocab_file = get_vocab_file(squad_version, data_dir)
+    if not force and os.path.isfile(vocab_file) and all(
+            _is_up_to_date(get_compiled_dir(tier, squad_version, data_dir), text_files[tier]) for tier in tiers):
+        return
+
+    vocab = [PAD_TOKEN, UNK_TOKEN]
+    if squad_version == 2.0:
+        vocab.append("unanswerable")
+    token_to_id = {token: i for i, token in enumerate(vocab)}
+
+    for tier in tiers:
+        print("Compiling {} data".format(tier))
+        compiled_dir = get_compiled_dir(tier, squad_version, data_dir)
+        if not os.path.exists(compiled_dir):
+            os.makedirs(compiled_dir)
+
+        context_file, question_file, span_file = text_files[tier][:3]
+
+        context_ids, context_offsets = _encode_lines(context_file, token_to_id, vocab)
+        question_ids, question_offsets = _encode_lines(question_file, token_to_id, vocab)
+        spans = np.loadtxt(span_file, dtype='int32', ndmin=2)
+
+        np.save(os.path.join(compiled_dir, 'context_ids.npy'), context_ids)
+        np.save(os.path.join(compiled_dir, 'context_offsets.npy'), context_offsets)
+        np.save(os.path.join(compiled_dir, 'question_ids.npy'), question_ids)
+        np.save(os.path.join(compiled_dir, 'question_offsets.npy'), question_offsets)
+
+        if squad_version == 2.0:
+            is_impossible = np.loadtxt(text_files[tier][3], dtype='int8', ndmin=1)
+            np.save(os.path.join(compiled_dir, 'is_impossible.npy'), is_impossible)
+
+        # spans are written last as they mark the compiled tier as complete
+        np.save(os.path.join(compiled_dir, 'spans.npy'), spans)
+
+    write_vocab(vocab_file, vocab)
+
+
+class CompiledDataset():
+
+    def __init__(self, tier, squad_version, data_dir=base_dir):
+        compiled_dir = get_compiled_dir(tier, squad_version, data_dir)
+
+        def load(name):
+            return np.load(os.path.join(compiled_dir, name + '.npy'), mmap_mode='r')
+
+        self.squad_version = squad_version
+        self.vocab = read_vocab(get_vocab_file(squad_version, data_dir))
+
+        self.context_ids = load('context_ids')
+        self.context_offsets = load('context_offsets')
+        self.question_ids = load('question_ids')
+        self.question_offsets = load('question_offsets')
+        self.spans = load('spans')
+        if squad_version == 2.0:
+            self.is_impossible = load('is_impossible')
+
+    def __len__(self):
+        return len(self.spans)
+
+    def context_lengths(self):
+        return np.diff(self.context_offsets)
+
+    def get_contexts(self, rows):
+        return [self.context_ids[self.context_offsets[row]:self.context_offsets[row + 1]] for row in rows]
+
+    def get_questions(self, rows):
+        return [self.question_ids[self.question_offsets[row]:self.question_offsets[row + 1]] for row in rows]
+
+    def to_tokens(self, ids):
+        return [self.vocab[token_id] for token_id in ids]
+
+
+def tokens_to_ids(tokens, token_to_id):
+    unk_id = token_to_id[UNK_TOKEN]
+    return [token_to_id.get(token, unk_id) for token in tokens]
+
+
+def pad_token_ids(sequences, pad_to_length=None):
+    """Packs sequences of token IDs into an int32 matrix, padded with the ID of the padding token (0) or truncated to
+    pad_to_length. If pad_to_length is None, the sequences are padded to the longest one."""
+    if pad_to_length is None:
+        pad_to_length = max(len(sequence) for sequence in sequences)
+
+    batch = np.zeros((len(sequences), pad_to_length), dtype='int32')
+    for i, sequence in enumerate(sequences):
+        sequence = sequence[:pad_to_length]
+        batch[i, :len(sequence)] = sequence
+    return batch
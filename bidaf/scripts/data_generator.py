@@ -2,9 +2,12 @@ from ..scripts import BatchGenerator
 
 
 def load_data_generators(batch_size, emdim, squad_version=1.1, max_passage_length=None, max_query_length=None,
-                         shuffle=False):
+                         shuffle=False, use_compiled_dataset=False, return_token_ids=False,
+                         embedding_subset=None, bucket_boundaries=None):
     train_generator = BatchGenerator('train', batch_size, emdim, squad_version, max_passage_length, max_query_length,
-                                     shuffle)
+                                     shuffle, use_compiled_dataset, return_token_ids, embedding_subset,
+                                     bucket_boundaries)
     validation_generator = BatchGenerator('dev', batch_size, emdim, squad_version, max_passage_length, max_query_length,
-                                          shuffle)
+                                          shuffle, use_compiled_dataset, return_token_ids, embedding_subset,
+                                          bucket_boundaries)
     return train_generator, validation_generator
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from .magnitude import MagnitudeVectors
+from .compiled_dataset import get_vocab_file, read_vocab, write_vocab, base_dir, PAD_TOKEN, UNK_TOKEN
+
+
+def build_embedding_matrix(vocab, emdim, chunk_size=10000):
+    """Queries the Magnitude vectors of every token in vocab, OOV tokens included, and stacks them in ID order.
+    The first row belongs to the padding token and is kept at zero."""
+    vectors = MagnitudeVectors(emdim).load_vectors()
+
+    embedding_matrix = np.zeros((len(vocab), emdim), dtype='float32')
+    for start in range(1, len(vocab), chunk_size):
+        tokens = vocab[start:start + chunk_size]
+        embedding_matrix[start:start + len(tokens)] = vectors.query(tokens)
+    return embedding_matrix
+
+
+def load_embedding_matrix(squad_version, emdim, data_dir=base_dir):
+    """Returns the vocabulary of the compiled dataset along with its embedding matrix, building the matrix and caching
+    it next to the vocabulary if it is missing or older than the vocabulary"""
+    vocab_file = get_vocab_file(squad_version, data_dir)
+    matrix_file = os.path.join(data_dir, 'squad-v{}.emb{}.npy'.format(squad_version, emdim))
+
+    vocab = read_vocab(vocab_file)
+    if os.path.isfile(matrix_file) and os.path.getmtime(matrix_file) >= os.path.getmtime(vocab_file):
+        return vocab, np.load(matrix_file)
+
+    print("Building embedding matrix for {} tokens".format(len(vocab)))
+    embedding_matrix = build_embedding_matrix(vocab, emdim)
+    np.save(matrix_file, embedding_matrix)
+    return vocab, embedding_matrix
+
+
+def get_embedding_subset_file(squad_version, emdim):
+    return os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'magnitude',
+                        'subset-v{}.{}d'.format(squad_version, emdim))
+
+
+def collect_vocab(corpus_files):
+    """Returns the sorted set of lowercased, space separated tokens found in the given files, split the way
+    BatchGenerator splits them"""
+    vocab = set()
+    for corpus_file in corpus_files:
+        with open(corpus_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                vocab.update(token.lower() for token in line.rstrip('\n').split(' '))
+    return sorted(vocab)
+
+
+def build_embedding_subset(corpus_files, emdim, subset_file, extra_tokens=(), force=False):
+    """Writes the Magnitude vectors of just the vocabulary of corpus_files, OOV vectors included, to subset_file.npy
+    along with the matching subset_file.vocab. MagnitudeVectors(emdim, subset_file=subset_file) serves them instead of
+    the full GloVe and fastText models. Nothing is rebuilt if the subset is newer than every corpus file."""
+    matrix_file = subset_file + '.npy'
+    if not force and os.path.isfile(matrix_file) and all(
+            os.path.getmtime(matrix_file) >= os.path.getmtime(corpus_file) for corpus_file in corpus_files):
+        return subset_file
+
+    tokens = set(collect_vocab(corpus_files)).union(extra_tokens).difference([PAD_TOKEN, UNK_TOKEN])
+    vocab = [PAD_TOKEN, UNK_TOKEN] + sorted(tokens)
+    print("Building embedding subset for {} tokens".format(len(vocab)))
+    embedding_matrix = build_embedding_matrix(vocab, emdim)
+
+    subset_dir = os.path.dirname(subset_file)
+    if subset_dir and not os.path.exists(subset_dir):
+        os.makedirs(subset_dir)
+    write_vocab(subset_file + '.vocab', vocab)
+    np.save(matrix_file, embedding_matrix)
+    return subset_file
+
+
+def build_squad_embedding_subset(squad_version, emdim, data_dir=base_dir, force=False):
+    """Builds the embedding subset covering the contexts and questions of the preprocessed SQuAD files"""
+    corpus_files = [os.path.join(data_dir, tier + '-v{}.{}'.format(squad_version, suffix))
+                    for tier in ('train', 'dev') for suffix in ('context', 'question')]
+    extra_tokens = ["unanswerable"] if squad_version == 2.0 else []
+    return build_embedding_subset(corpus_files, emdim, get_embedding_subset_file(squad_version, emdim),
+                                  extra_tokens=extra_tokens, force=force)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+class ExternalShuffle():
+    """Shuffles more lines than fit in memory, using temporary files.
+
+    Lines are spooled to disk as they are added. Iterating deals them out to random buckets of about max_bucket_bytes
+    each, then yields every bucket shuffled in memory. The result is a uniform shuffle that is deterministic for a given
+    seed, and at most one bucket is held in memory at a time.
+    """
+
+    def __init__(self, max_bucket_bytes=64 << 20, seed=42, temp_dir=None, chunk_size=10000):
+        self.max_bucket_bytes = max_bucket_bytes
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.temp_dir = tempfile.mkdtemp(prefix='bidaf-shuffle-', dir=temp_dir)
+        self.spool_file = os.path.join(self.temp_dir, 'spool')
+        self.spool = open(self.spool_file, 'w', encoding='utf-8')
+        self.num_bytes = 0
+        self.num_lines = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.num_lines
+
+    def add(self, line):
+        line = line + '\n'
+        self.spool.write(line)
+        self.num_bytes += len(line.encode('utf-8'))
+        self.num_lines += 1
+
+    def __iter__(self):
+        self.spool.close()
+        random_state = np.random.RandomState(self.seed)
+        num_buckets = max(1, -(-self.num_bytes // self.max_bucket_bytes))
+
+        if num_buckets == 1:
+            bucket_files = [self.spool_file]
+        else:
+            bucket_files = [os.path.join(self.temp_dir, 'bucket-{}'.format(i)) for i in range(num_buckets)]
+            buckets = [open(bucket_file, 'w', encoding='utf-8') for bucket_file in bucket_files]
+            try:
+                with open(self.spool_file, 'r', encoding='utf-8') as spool:
+                    chunk = []
+                    for line in spool:
+                        chunk.append(line)
+                        if len(chunk) == self.chunk_size:
+                            self.deal(chunk, buckets, random_state)
+                            chunk = []
+                    self.deal(chunk, buckets, random_state)
+            finally:
+                for bucket in buckets:
+                    bucket.close()
+            os.remove(self.spool_file)
+
+        for bucket_file in bucket_files:
+            with open(bucket_file, 'r', encoding='utf-8') as bucket:
+                lines = bucket.readlines()
+            for i in random_state.permutation(len(lines)):
+                yield lines[i][:-1]
+            os.remove(bucket_file)
+
+    @staticmethod
+    def deal(lines, buckets, random_state):
+        for line, bucket in zip(lines, random_state.randint(len(buckets), size=len(lines))):
+            buckets[bucket].write(line)
+
+    def close(self):
+        if not self.spool.closed:
+            self.spool.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
@@ -0,0 +1,126 @@
+import json
+import threading
+from itertools import islice
+from queue import Queue
+import numpy as np
+from .preprocess import tokenize, tokenize_with_offsets, iter_json_array
+
+
+def iter_prediction_examples(input_file):
+    """Yields the (id, passage, question) of every example of a JSONL file, one {"id", "passage", "question"} object
+    per line, or of a SQuAD-format JSON file (.json), reading either one incrementally"""
+    if input_file.endswith('.json'):
+        for article in iter_json_array(input_file, 'data'):
+            for para in article['paragraphs']:
+                for qn in para['qas']:
+                    yield qn['id'], para['context'], qn['question']
+    else:
+        with open(input_file, encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                if not line.strip():
+                    continue
+                example = json.loads(line)
+                yield example.get('id', line_number), example['passage'], example['question']
+
+
+class FilePredictor():
+    """Predicts the answers of the examples of a file and writes them to a JSONL file as they come, one
+    {"id", "answer"} object per line, in input order.
+
+    Examples are read chunk_size at a time. A background thread tokenizes and embeds the next chunks, sorted by passage
+    length and cut into batches, while the model runs on the current one. At most prefetch_chunks chunks wait in
+    between, so memory doesn't grow with the size of the input file.
+    """
+
+    def __init__(self, bidaf_model, squad_version=1.1, max_span_length=25, do_lowercase=True,
+                 return_char_loc=False, return_confidence_score=False, top_k=None, chunk_size=1000, batch_size=32,
+                 prefetch_chunks=2, tokenizer='nltk'):
+        self.bidaf_model = bidaf_model
+        self.squad_version = squad_version
+        self.max_span_length = max_span_length
+        self.do_lowercase = do_lowercase
+        self.return_char_loc = return_char_loc
+        self.return_confidence_score = return_confidence_score
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.prefetch_chunks = prefetch_chunks
+        self.tokenizer = tokenizer
+
+    def prepare_chunk(self, examples):
+        ids, passages, contexts, context_offsets, questions = [], [], [], [], []
+        for example_id, passage, question in examples:
+            passage = passage.strip()
+            ids.append(example_id)
+            passages.append(passage)
+            context_tokens, token_offsets = tokenize_with_offsets(passage, self.do_lowercase, self.tokenizer)
+            contexts.append(context_tokens)
+            context_offsets.append(token_offsets)
+            questions.append(tokenize(question, self.do_lowercase, self.tokenizer))
+
+        batches = []
+        order = np.argsort([len(context) for context in contexts], kind='stable')
+        for start in range(0, len(order), self.batch_size):
+            batch_indices = order[start:start + self.batch_size]
+            batch_contexts = [contexts[i] for i in batch_indices]
+            batch_questions = [questions[i] for i in batch_indices]
+            batches.append((batch_indices, batch_contexts, batch_questions,
+                            self.bidaf_model.embed_batch(batch_contexts, batch_questions)))
+        return ids, passages, contexts, context_offsets, batches
+
+    def produce_chunks(self, input_file, chunks):
+        try:
+            examples = iter_prediction_examples(input_file)
+            while True:
+                chunk = list(islice(examples, self.chunk_size))
+                if not chunk:
+                    break
+                chunks.put(self.prepare_chunk(chunk))
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+
+    def predict_chunk(self, chunk):
+        ids, passages, contexts, context_offsets, batches = chunk
+        candidates = [None] * len(ids)
+        for batch_indices, batch_contexts, batch_questions, inputs in batches:
+            batch_candidates = self.bidaf_model.decode_spans(batch_contexts, batch_questions, self.squad_version,
+                                                             self.max_span_length, self.top_k, inputs=inputs)
+            for index, sample_candidates in zip(batch_indices, batch_candidates):
+                candidates[index] = sample_candidates
+
+        for index, example_id in enumerate(ids):
+            answers = self.bidaf_model.build_answers(passages[index], contexts[index], candidates[index],
+                                                     self.return_char_loc, self.return_confidence_score,
+                                                     context_offsets[index], self.do_lowercase)
+            for answer in answers:
+                if "confidence_score" in answer:
+                    answer["confidence_score"] = float(answer["confidence_score"])
+            yield {"id": example_id, "answer": answers if self.top_k is not None else answers[0]}
+
+    def predict(self, input_file, output_file):
+        """Returns the number of examples predicted"""
+        chunks = Queue(maxsize=self.prefetch_chunks)
+        producer = threading.Thread(target=self.produce_chunks, args=(input_file, chunks), daemon=True)
+        producer.start()
+
+        num_examples = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                for prediction in self.predict_chunk(chunk):
+                    f.write(json.dumps(prediction) + '\n')
+                    num_examples += 1
+                f.flush()
+
+        producer.join()
+        return num_examples
+
+
+def predict_file(bidaf_model, input_file, output_file, **kwargs):
+    """Writes the predictions of the examples of input_file to output_file, see FilePredictor for the arguments"""
+    return FilePredictor(bidaf_model, **kwargs).predict(input_file, output_file)
@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from queue import Queue, Empty
+import numpy as np
+from keras import backend as K
+from .stage_timer import PrometheusSink
+
+
+class LatencyStats():
+    """Keeps the latencies of the last window_size requests and the sizes of the last window_size batches"""
+
+    def __init__(self, window_size=10000):
+        self.latencies = deque(maxlen=window_size)
+        self.batch_sizes = deque(maxlen=window_size)
+        self.num_requests = 0
+        self.num_errors = 0
+        self.lock = threading.Lock()
+
+    def add_batch(self, latencies, failed=False):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(len(latencies))
+            self.num_requests += len(latencies)
+            if failed:
+                self.num_errors += len(latencies)
+
+    def summary(self, percentiles=(50, 90, 95, 99)):
+        with self.lock:
+            latencies = np.array(self.latencies, dtype='float64') * 1000
+            batch_sizes = np.array(self.batch_sizes, dtype='float64')
+            summary = {
+                "requests": self.num_requests,
+                "errors": self.num_errors,
+                "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+            }
+        for percentile in percentiles:
+            summary["latency_p{}_ms".format(percentile)] = \
+                float(np.percentile(latencies, percentile)) if len(latencies) else 0.0
+        return summary
+
+
+class PendingRequest():
+
+    def __init__(self, passage, question, options):
+        self.passage = passage
+        self.question = question
+        self.options = options
+        self.arrival_time = time.time()
+        self.done = threading.Event()
+        self.answer = None
+        self.error = None
+
+
+class MicroBatcher():
+    """Coalesces the requests of concurrent clients into batches for a single model thread.
+
+    A batch is run once it holds max_batch_size requests, or max_wait_ms after its first request arrived. Requests of a
+    batch are split by top_k and handed to predict_ans, which runs them on passages of similar lengths together. When a
+    batch fails, its requests are run again one at a time so that only the failing ones get the error. A client gives
+    up on its request after timeout seconds.
+    """
+
+    def __init__(self, bidaf_model, max_batch_size=32, max_wait_ms=10, squad_version=1.1, max_span_length=25,
+                 do_lowercase=True, stats=None, metrics_sink=None, timeout=60, tokenizer='nltk'):
+        self.bidaf_model = bidaf_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.squad_version = squad_version
+        self.max_span_length = max_span_length
+        self.do_lowercase = do_lowercase
+        self.tokenizer = tokenizer
+        self.stats = stats if stats is not None else LatencyStats()
+        self.metrics_sink = metrics_sink
+        self.requests = Queue()
+
+        # Keras models must be run in the graph and session they were loaded in. Building the predict function up
+        # front avoids building it lazily from the batching thread.
+        self.session = K.get_session()
+        self.graph = self.session.graph
+        bidaf_model.model._make_predict_function()
+
+        self.thread = threading.Thread(target=self.run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def predict(self, passage, question, top_k=None, return_char_loc=False, return_confidence_score=False):
+        """Queues a request and blocks until its batch has been run"""
+        request = PendingRequest(passage, question, {"top_k": top_k, "return_char_loc": return_char_loc,
+                                                     "return_confidence_score": return_confidence_score})
+        self.requests.put(request)
+        if not request.done.wait(self.timeout):
+            raise TimeoutError("No answer within {} seconds".format(self.timeout))
+        if request.error is not None:
+            raise request.error
+        return request.answer
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        deadline = batch[0].arrival_time + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def run(self):
+        with self.graph.as_default(), self.session.as_default():
+            while True:
+                batch = self.next_batch()
+                try:
+                    for top_k in set(request.options["top_k"] for request in batch):
+                        self.run_batch([request for request in batch if request.options["top_k"] == top_k], top_k)
+                except Exception as e:
+                    # this thread serves every client, it must outlive any request
+                    for request in batch:
+                        if not request.done.is_set():
+                            request.error = e
+                            request.done.set()
+
+    def run_batch(self, batch, top_k):
+        failed = False
+        try:
+            answers = self.bidaf_model.predict_ans([request.passage for request in batch],
+                                                   [request.question for request in batch],
+                                                   squad_version=self.squad_version,
+                                                   max_span_length=self.max_span_length,
+                                                   do_lowercase=self.do_lowercase, return_char_loc=True,
+                                                   return_confidence_score=True, top_k=top_k,
+                                                   batch_size=self.max_batch_size, tokenizer=self.tokenizer,
+                                                   metrics_sink=self.metrics_sink)
+            for request, answer in zip(batch, answers):
+                request.answer = [self.filter_answer(ans, request.options) for ans in answer] \
+                    if top_k is not None else self.filter_answer(answer, request.options)
+        except Exception as e:
+            if len(batch) > 1:
+                # one bad request must not fail the requests of other clients batched with it
+                for request in batch:
+                    self.run_batch([request], top_k)
+                return
+            failed = True
+            batch[0].error = e
+
+        finish_time = time.time()
+        self.stats.add_batch([finish_time - request.arrival_time for request in batch], failed)
+        for request in batch:
+            request.done.set()
+
+    @staticmethod
+    def filter_answer(answer, options):
+        answer = dict(answer)
+        if not options["return_char_loc"]:
+            answer.pop("char_loc_start")
+            answer.pop("char_loc_end")
+        if options["return_confidence_score"]:
+            answer["confidence_score"] = float(answer["confidence_score"])
+        else:
+            answer.pop("confidence_score")
+        return answer
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_request_handler(batcher):
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def send_content(self, status, content, content_type):
+            content = content.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def send_json(self, status, body):
+            self.send_content(status, json.dumps(body), 'application/json')
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, batcher.stats.summary())
+            elif self.path == '/metrics' and hasattr(batcher.metrics_sink, 'render'):
+                # any callable can be a metrics sink, only the ones like PrometheusSink can be rendered
+                self.send_content(200, batcher.metrics_sink.render(), 'text/plain; version=0.0.4')
+            else:
+                self.send_json(404, {"error": "Unknown path '{}'".format(self.path)})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {"error": "Unknown path '{}'".format(self.path)})
+                return
+
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+                passage, question, top_k = body["passage"], body["question"], body.get("top_k")
+                if type(passage) != str or type(question) != str:
+                    raise TypeError("Both 'passage' and 'question' must be of type 'string'")
+                if not passage.strip() or not question.strip():
+                    raise ValueError("Both 'passage' and 'question' must be non-empty")
+                if top_k is not None and (type(top_k) != int or top_k < 1):
+                    raise ValueError("'top_k' must be a positive integer")
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {"error": "Invalid request: {}".format(e)})
+                return
+
+            try:
+                answer = batcher.predict(passage, question, top_k=top_k,
+                                         return_char_loc=body.get("return_char_loc", False),
+                                         return_confidence_score=body.get("return_confidence_score", False))
+            except Exception as e:
+                self.send_json(500, {"error": str(e)})
+                return
+            self.send_json(200, {"answer": answer})
+
+        def log_message(self, format, *args):
+            # one line per request would slow the server down under load, /stats reports on the requests instead
+            pass
+
+    return RequestHandler
+
+
+def serve(bidaf_model, host='localhost', port=8000, max_batch_size=32, max_wait_ms=10, squad_version=1.1,
+          max_span_length=25, do_lowercase=True, tokenizer='nltk'):
+    """Serves predictions of a loaded model over HTTP until interrupted.
+
+    POST /predict takes a JSON object with a 'passage' and a 'question' and optionally 'top_k', 'return_char_loc' and
+    'return_confidence_score', and answers with {"answer": ...}. GET /stats returns request counts, the mean batch
+    size and latency percentiles, GET /metrics the time spent in every stage of the predictions in the Prometheus
+    text format.
+    """
+    batcher = MicroBatcher(bidaf_model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                           squad_version=squad_version, max_span_length=max_span_length, do_lowercase=do_lowercase,
+                           tokenizer=tokenizer, metrics_sink=PrometheusSink())
+    server = ThreadingHTTPServer((host, port), make_request_handler(batcher))
+    print("Serving predictions on http://{}:{}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+
+
+def get_index_file(data_file):
+    return data_file + '.index.npy'
+
+
+def build_line_index(data_file):
+    """Returns an array holding the byte offset of every line in data_file followed by the size of the file"""
+    offsets = [0]
+    with open(data_file, 'rb') as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+    return np.array(offsets, dtype='int64')
+
+
+def load_line_index(data_file):
+    """Loads the byte offset index of data_file, building it and caching it next to the file if it is missing or stale"""
+    index_file = get_index_file(data_file)
+    file_size = os.path.getsize(data_file)
+
+    if os.path.isfile(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(data_file):
+        offsets = np.load(index_file)
+        if offsets[-1] == file_size:
+            return offsets
+
+    offsets = build_line_index(data_file)
+    np.save(index_file, offsets)
+    return offsets
+
+
+def read_lines(data_file, offsets, rows):
+    """Reads the lines at the given (0-based) row numbers, in the given order, by seeking to their offsets"""
+    rows = np.asarray(rows, dtype='int64')
+    lines = [None] * len(rows)
+
+    with open(data_file, 'rb') as f:
+        # visit the rows in file order so that the reads stay as sequential as possible
+        for position in np.argsort(rows, kind='stable'):
+            row = rows[position]
+            f.seek(offsets[row])
+            line = f.read(offsets[row + 1] - offsets[row]).decode('utf-8')
+            if line.endswith('\n'):
+                line = line[:-1]
+            lines[position] = line
+
+    return lines
+
+
+def load_line_lengths(data_file):
+    """Returns the number of space separated tokens on every line of data_file, cached next to the file like its index"""
+    lengths_file = data_file + '.lengths.npy'
+    if os.path.isfile(lengths_file) and os.path.getmtime(lengths_file) >= os.path.getmtime(data_file):
+        return np.load(lengths_file)
+
+    with open(data_file, 'rb') as f:
+        lengths = np.array([line.count(b' ') + 1 for line in f], dtype='int32')
+    np.save(lengths_file, lengths)
+    return lengths
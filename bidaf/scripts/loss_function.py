@@ -1,17 +1,23 @@
 from keras import backend as K
 
 
-def negative_avg_log_error(y_true, y_pred):
+def negative_avg_log_error(y_true, y_pred, from_logits=False):
 
-    def sum_of_log_probabilities(true_and_pred):
-        y_true, y_pred_start, y_pred_end = true_and_pred
+    def log_probabilities_of(y_true, y_pred):
+        # picks y_pred[i, y_true[i]] for every sample i of the batch at once
+        true_positions = K.one_hot(y_true, K.shape(y_pred)[-1])
+        if from_logits:
+            log_probabilities = y_pred - K.logsumexp(y_pred, axis=-1, keepdims=True)
+            return K.sum(true_positions * log_probabilities, axis=-1)
+        return K.log(K.sum(true_positions * y_pred, axis=-1))
 
-        start_probability = y_pred_start[K.cast(y_true[0], dtype='int32')]
-        end_probability = y_pred_end[K.cast(y_true[1], dtype='int32')]
-        return K.log(start_probability) + K.log(end_probability)
-
-    y_true = K.squeeze(y_true, axis=1)
+    y_true = K.cast(K.squeeze(y_true, axis=1), dtype='int32')
     y_pred_start = y_pred[:, 0, :]
     y_pred_end = y_pred[:, 1, :]
-    batch_probability_sum = K.map_fn(sum_of_log_probabilities, (y_true, y_pred_start, y_pred_end), dtype='float32')
+    batch_probability_sum = log_probabilities_of(y_true[:, 0], y_pred_start) + \
+        log_probabilities_of(y_true[:, 1], y_pred_end)
     return -K.mean(batch_probability_sum, axis=0)
+
+
+def negative_avg_log_error_from_logits(y_true, y_pred):
+    return negative_avg_log_error(y_true, y_pred, from_logits=True)
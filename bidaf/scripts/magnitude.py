@@ -1,25 +1,149 @@
 import os
+import threading
+from collections import OrderedDict
+import numpy as np
 from pymagnitude import Magnitude, MagnitudeUtils
+from .compiled_dataset import read_vocab, UNK_TOKEN
+
+
+class CachedVectors():
+    """Bounded LRU cache of token vectors in front of a case insensitive Magnitude object, keyed on lowercased tokens.
+
+    query() accepts the same inputs as Magnitude.query: a list of tokens, giving a (tokens, dim) array, or a list of
+    token lists, giving a (batch, length, dim) array padded with zero vectors (or truncated) to pad_to_length.
+    """
+
+    def __init__(self, vectors, cache_size):
+        self.vectors = vectors
+        self.dim = vectors.dim
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, tokens):
+        keys = [token.lower() for token in tokens]
+        result = np.zeros((len(keys), self.dim), dtype='float32')
+
+        missing = []
+        with self.lock:
+            for i, key in enumerate(keys):
+                vector = self.cache.get(key)
+                if vector is None:
+                    missing.append(i)
+                else:
+                    self.cache.move_to_end(key)
+                    result[i] = vector
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # query pymagnitude outside of the lock, once per distinct token
+            missing_keys = list(OrderedDict.fromkeys(keys[i] for i in missing))
+            # rows are copied out, a view would keep the whole array of the query alive in the cache
+            missing_vectors = {key: np.array(vector, dtype='float32')
+                               for key, vector in zip(missing_keys, self.vectors.query(missing_keys))}
+            for i in missing:
+                result[i] = missing_vectors[keys[i]]
+
+            with self.lock:
+                self.cache.update(missing_vectors)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        return result
+
+    def query(self, q, pad_to_length=None):
+        if len(q) == 0 or isinstance(q[0], str):
+            return self.lookup(q)
+
+        if pad_to_length is None:
+            pad_to_length = max(len(tokens) for tokens in q)
+        q = [tokens[:pad_to_length] for tokens in q]
+
+        flat_vectors = self.lookup([token for tokens in q for token in tokens])
+        batch = np.zeros((len(q), pad_to_length, self.dim), dtype='float32')
+        start = 0
+        for i, tokens in enumerate(q):
+            batch[i, :len(tokens)] = flat_vectors[start:start + len(tokens)]
+            start += len(tokens)
+        return batch
+
+    def cache_info(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.cache),
+                "max_size": self.cache_size,
+            }
+
+    def clear_cache(self):
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class SubsetVectors():
+    """Serves the vectors of an embedding subset written by build_embedding_subset from a memory-mapped matrix.
+    Tokens outside of the subset get the vector of the unknown token."""
+
+    def __init__(self, subset_file):
+        vocab = read_vocab(subset_file + '.vocab')
+        self.token_to_id = {token: i for i, token in enumerate(vocab)}
+        self.unk_id = self.token_to_id[UNK_TOKEN]
+        self.matrix = np.load(subset_file + '.npy', mmap_mode='r')
+        self.dim = self.matrix.shape[1]
+
+    def query(self, tokens):
+        return self.matrix[[self.token_to_id.get(token, self.unk_id) for token in tokens]]
 
 
 class MagnitudeVectors():
 
-    def __init__(self, emdim):
+    # Magnitude stores opened so far, keyed by (emdim, subset file, process id). They are shared by every
+    # MagnitudeVectors of a process, so the generators and the predict calls open the SQLite-backed files once. A
+    # forked worker opens its own connections instead of reusing the ones inherited from its parent, while the files
+    # themselves are read through the OS page cache which is shared by all processes.
+    shared_vectors = {}
+    shared_vectors_lock = threading.Lock()
 
-        base_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'data')
+    def __init__(self, emdim, cache_size=100000, subset_file=None):
 
+        self.base_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'data')
+
+        self.emdim = emdim
+        self.cache_size = cache_size
+        self.subset_file = subset_file
         self.fasttext_dim = 300
         self.glove_dim = emdim - 300
 
         assert self.glove_dim in [50, 100, 200,
                                   300], "Embedding dimension must be one of the following: 350, 400, 500, 600"
 
+    def open_vectors(self):
+        if self.subset_file is not None:
+            vectors = SubsetVectors(self.subset_file)
+            assert vectors.dim == self.emdim, "Embedding subset has a dimension of {}".format(vectors.dim)
+            return vectors
+
         print("Will download magnitude files from the server if they aren't avaialble locally.. So, grab a cup of coffee while the downloading is under progress..")
         glove = Magnitude(MagnitudeUtils.download_model('glove/medium/glove.6B.{}d'.format(self.glove_dim),
-                                                        download_dir=os.path.join(base_dir, 'magnitude')), case_insensitive=True)
+                                                        download_dir=os.path.join(self.base_dir, 'magnitude')), case_insensitive=True)
         fasttext = Magnitude(MagnitudeUtils.download_model('fasttext/medium/wiki-news-300d-1M-subword',
-                                                           download_dir=os.path.join(base_dir, 'magnitude')), case_insensitive=True)
-        self.vectors = Magnitude(glove, fasttext)
+                                                           download_dir=os.path.join(self.base_dir, 'magnitude')), case_insensitive=True)
+        return Magnitude(glove, fasttext)
 
     def load_vectors(self):
-        return self.vectors
+        key = (self.emdim, self.subset_file, os.getpid())
+        with MagnitudeVectors.shared_vectors_lock:
+            if key not in MagnitudeVectors.shared_vectors:
+                MagnitudeVectors.shared_vectors[key] = CachedVectors(self.open_vectors(), self.cache_size)
+            vectors = MagnitudeVectors.shared_vectors[key]
+            # the most recently requested size wins, entries above it are evicted on the next lookup
+            vectors.cache_size = self.cache_size
+            return vectors
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def get_best_span(span_begin_probs, span_end_probs, context_length, squad_version, max_span_length):
     if len(span_begin_probs.shape) > 2 or len(span_end_probs.shape) > 2:
         raise ValueError("Input shapes must be (X,) or (1,X)")
@@ -8,33 +11,60 @@ def get_best_span(span_begin_probs, span_end_probs, context_length, squad_versio
         assert span_end_probs.shape[0] == 1, "2D input must have an initial dimension of 1"
         span_end_probs = span_end_probs.flatten()
 
-    max_span_probability = 0
-    best_word_span = (0, 1)
+    best_word_spans, max_span_probabilities = get_best_span_batch(
+        span_begin_probs[np.newaxis, :], span_end_probs[np.newaxis, :], [context_length], squad_version,
+        max_span_length)
 
-    for i, val1 in enumerate(span_begin_probs):
-        if squad_version == 2.0 and i == 0:
-            continue
+    return tuple(best_word_spans[0].tolist()), max_span_probabilities[0]
 
-        for j, val2 in enumerate(span_end_probs):
-            if j > context_length - 1:
-                break
 
-            if (squad_version == 2.0 and j == 0) or (j < i):
-                continue
+def get_best_span_batch(span_begin_probs, span_end_probs, context_lengths, squad_version, max_span_length):
+    """Finds the most probable answer span of every sample of a batch at once.
 
-            if (j - i) >= max_span_length:
-                break
+    span_begin_probs and span_end_probs have a shape of (batch, P). Only the band of spans starting at i and ending
+    at j with i <= j < i + max_span_length and j < context_length is searched. For SQuAD 2.0, position 0 stands for
+    "no answer": it is excluded from the search and the null span (0, 0) is returned if it scores higher than the
+    best span. Ties are resolved in favour of the smallest (i, j), like a search in row-major order.
+
+    Returns a (batch, 2) array of word spans and a (batch, ) array of their probabilities.
+    """
+    span_begin_probs = np.asarray(span_begin_probs)
+    span_end_probs = np.asarray(span_end_probs)
+    context_lengths = np.asarray(context_lengths)
+    batch_size, passage_length = span_begin_probs.shape
+    band_width = max(0, min(int(max_span_length), passage_length))
 
-            if val1 * val2 > max_span_probability:
-                best_word_span = (i, j)
-                max_span_probability = val1 * val2
+    # span_ends[i, k] is the end position of the span that begins at i and is k + 1 words long
+    span_ends = np.arange(passage_length)[:, np.newaxis] + np.arange(band_width)[np.newaxis, :]
+    padded_end_probs = np.concatenate(
+        [span_end_probs, np.zeros((batch_size, band_width), dtype=span_end_probs.dtype)], axis=1)
 
+    span_probabilities = span_begin_probs[:, :, np.newaxis] * padded_end_probs[:, span_ends]
+    valid_spans = span_ends[np.newaxis, :, :] < context_lengths[:, np.newaxis, np.newaxis]
     if squad_version == 2.0:
-        if span_begin_probs[0] * span_end_probs[0] > max_span_probability:
-            best_word_span = (0, 0)
-            max_span_probability = span_begin_probs[0] * span_end_probs[0]
+        valid_spans[:, 0, :] = False
+    span_probabilities = np.where(valid_spans, span_probabilities, 0)
 
-    return best_word_span, max_span_probability
+    best_word_spans = np.tile(np.array([0, 1]), (batch_size, 1))
+    max_span_probabilities = np.zeros(batch_size, dtype=span_probabilities.dtype)
+
+    if band_width > 0:
+        span_probabilities = span_probabilities.reshape(batch_size, -1)
+        best_indices = np.argmax(span_probabilities, axis=1)
+        best_probabilities = span_probabilities[np.arange(batch_size), best_indices]
+        found = best_probabilities > 0
+        best_begins, best_lengths = np.divmod(best_indices, band_width)
+        best_word_spans[found, 0] = best_begins[found]
+        best_word_spans[found, 1] = best_begins[found] + best_lengths[found]
+        max_span_probabilities[found] = best_probabilities[found]
+
+    if squad_version == 2.0:
+        null_probabilities = span_begin_probs[:, 0] * span_end_probs[:, 0]
+        is_null = null_probabilities > max_span_probabilities
+        best_word_spans[is_null] = 0
+        max_span_probabilities[is_null] = null_probabilities[is_null]
+
+    return best_word_spans, max_span_probabilities
 
 
 def get_word_char_loc_mapping(context, context_tokens):
@@ -50,4 +80,45 @@ def get_word_char_loc_mapping(context, context_tokens):
     assert len(mapping) == len(
         context_tokens), "Error occurred while mapping word index to character index.. Please report this issue on our GitHub repo."
 
-    return mapping
\ No newline at end of file
+    return mapping
+
+
+def softmax(logits, axis=-1):
+    probabilities = np.exp(logits - logits.max(axis=axis, keepdims=True))
+    return probabilities / probabilities.sum(axis=axis, keepdims=True)
+
+
+def sequence_mask(lengths, max_length):
+    """Returns a float (batch, max_length) mask holding 1 for the first lengths[i] positions of row i and 0 after"""
+    return (np.arange(max_length)[np.newaxis, :] < np.asarray(lengths)[:, np.newaxis]).astype('float32')
+
+
+def check_window(window_size, window_stride):
+    """Raises a ValueError unless windows of window_size tokens, window_stride tokens apart, cover every token"""
+    if window_size < 1:
+        raise ValueError("window_size must be at least 1, got {}".format(window_size))
+    if not 1 <= window_stride <= window_size:
+        raise ValueError("window_stride must be between 1 and window_size ({}), got {}".format(window_size,
+                                                                                             window_stride))
+
+
+def get_window_starts(num_tokens, window_size, window_stride):
+    """Returns the first token of every window of window_size tokens, window_stride tokens apart, needed to cover a
+    passage of num_tokens tokens. The last window is moved back so that it ends with the passage."""
+    check_window(window_size, window_stride)
+    window_starts = list(range(0, max(num_tokens - window_size, 0) + 1, window_stride))
+    if window_starts[-1] + window_size < num_tokens:
+        window_starts.append(num_tokens - window_size)
+    return window_starts
+
+
+def merge_window_candidates(window_candidates, top_k=1):
+    """Merges the (start, end, score) candidates of the windows of a passage, their word indices already made global,
+    into the top_k best non-overlapping ones. Windows overlap, so the same span may come from two windows."""
+    merged = []
+    for start, end, confidence_score in sorted(window_candidates, key=lambda candidate: -candidate[2]):
+        if all(end < chosen_start or start > chosen_end for chosen_start, chosen_end, _ in merged):
+            merged.append((start, end, confidence_score))
+            if len(merged) == top_k:
+                break
+    return merged
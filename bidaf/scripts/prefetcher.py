@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+from keras.utils import Sequence
+from keras.callbacks import Callback
+
+
+class Prefetcher(Sequence):
+    """Builds the batches of a Sequence ahead of the model in background threads.
+
+    Up to depth batches are requested at a time from num_threads threads. Reading, embedding and padding happen there,
+    while the model is busy with the current batch. Batches are handed over in order as contiguous arrays. Train with
+    workers=0 so that Keras reads them from the calling thread. Keras then reads a Sequence in index order whatever its
+    shuffle argument, so with shuffle set the Prefetcher visits the batches in an order of its own, drawn again every
+    epoch.
+
+    Every read of a batch that isn't ready yet is a starvation, and the time spent waiting for it is recorded. Large
+    numbers mean that the input pipeline, not the model, bounds the training speed.
+    """
+
+    def __init__(self, sequence, depth=4, num_threads=2, shuffle=False):
+        self.sequence = sequence
+        self.depth = depth
+        self.shuffle = shuffle
+        self.executor = ThreadPoolExecutor(max_workers=num_threads)
+        self.pending = deque()
+        self.next_index = 0
+        self.order = self.make_order()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+        # batches built ahead only count as served once they are handed over
+        if hasattr(sequence, 'mark_served'):
+            sequence.count_on_read = False
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def make_order(self):
+        return np.random.permutation(len(self.sequence)) if self.shuffle else np.arange(len(self.sequence))
+
+    def build_batch(self, index):
+        inputs, outputs = self.sequence[index]
+        return [np.ascontiguousarray(x) for x in inputs], [np.ascontiguousarray(y) for y in outputs]
+
+    def schedule(self):
+        while len(self.pending) < self.depth and self.next_index < len(self):
+            self.pending.append((self.next_index,
+                                 self.executor.submit(self.build_batch, int(self.order[self.next_index]))))
+            self.next_index += 1
+
+    def restart(self, index):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.next_index = index
+        self.schedule()
+
+    def __getitem__(self, index):
+        with self.lock:
+            if not self.pending or self.pending[0][0] != index:
+                # batches are expected in order, any other access starts prefetching again from the requested batch
+                self.restart(index)
+            _, future = self.pending.popleft()
+            self.schedule()
+
+        starved = not future.done()
+        start_time = time.time()
+        batch = future.result()
+        wait_time = time.time() - start_time
+
+        with self.lock:
+            self.num_batches += 1
+            self.wait_time += wait_time
+            if starved:
+                self.num_starved += 1
+        if hasattr(self.sequence, 'mark_served'):
+            self.sequence.mark_served(int(self.order[index]))
+        return batch
+
+    def on_epoch_end(self):
+        with self.lock:
+            for _, future in self.pending:
+                future.cancel()
+            # batches already being built still read the state of the sequence, which on_epoch_end shuffles
+            wait([future for _, future in self.pending])
+            self.pending.clear()
+            self.sequence.on_epoch_end()
+            self.order = self.make_order()
+            self.next_index = 0
+            self.schedule()
+
+    def reset_stats(self):
+        self.num_batches = 0
+        self.num_starved = 0
+        self.wait_time = 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "batches": self.num_batches,
+                "starved_batches": self.num_starved,
+                "starved_fraction": self.num_starved / self.num_batches if self.num_batches else 0.0,
+                "data_wait_time": self.wait_time,
+            }
+
+    def close(self):
+        with self.lock:
+            for _, future in self.pending:
+                future.cancel()
+            self.pending.clear()
+        self.executor.shutdown(wait=False)
+
+
+class PrefetchStats(Callback):
+    """Adds the starvation statistics of a Prefetcher over every epoch to the epoch logs, ahead of CSVLogger"""
+
+    def __init__(self, prefetcher, prefix='prefetch_'):
+        super(PrefetchStats, self).__init__()
+        self.prefetcher = prefetcher
+        self.prefix = prefix
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.prefetcher.reset_stats()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            for key, value in self.prefetcher.stats().items():
+                logs[self.prefix + key] = value
@@ -2,11 +2,19 @@
 
 import os
 import random
+import re
 import json
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from itertools import islice
+from multiprocessing import Pool
 import nltk
 import numpy as np
 from tqdm import tqdm
 from six.moves.urllib.request import urlretrieve
+from .tokenizers import get_tokenizer
+from .preprocess_cache import ArticleCache, file_hash, article_hash
+from .external_shuffle import ExternalShuffle
 
 random.seed(42)
 np.random.seed(42)
@@ -29,18 +37,66 @@ def data_from_json(filename):
     return data
 
 
-def tokenize(sequence, do_lowercase):
-    """Tokenizes the input sequence using nltk's word_tokenize function, replaces two single quotes with a double quote"""
-
+def iter_json_array(filename, key='data', chunk_size=1 << 20):
+    """Yields the elements of the array stored under key in the top-level object of the JSON file one at a time,
+    reading the file in chunks of chunk_size characters instead of loading it whole like data_from_json"""
+    decoder = json.JSONDecoder()
+    with open(filename, encoding='utf-8') as data_file:
+        buffer = ''
+        array_start = None
+        while array_start is None:
+            chunk = data_file.read(chunk_size)
+            if not chunk:
+                raise ValueError("No '{}' array found in {}".format(key, filename))
+            buffer += chunk
+            match = re.search(r'"{}"\s*:\s*\['.format(re.escape(key)), buffer)
+            if match is not None:
+                array_start = match.end()
+        buffer = buffer[array_start:]
+
+        position = 0
+        read_size = chunk_size
+        while True:
+            # skip the separators between two elements
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # the element continues in the next chunk. Every attempt parses it again from its start, so the reads
+                # double in size to keep that linear in the size of the element.
+                chunk = data_file.read(read_size)
+                if not chunk:
+                    raise ValueError("Unexpected end of file in the '{}' array of {}".format(key, filename))
+                buffer = buffer[position:] + chunk
+                position = 0
+                read_size *= 2
+                continue
+            read_size = chunk_size
+            yield element
+
+
+def tokenize(sequence, do_lowercase, tokenizer='nltk'):
+    """Tokenizes the input sequence using nltk's word_tokenize function, or the tokenizer registered under the given
+    name in tokenizers.py, replaces two single quotes with a double quote"""
+
+    tokens = get_tokenizer(tokenizer).tokenize(sequence)
     if do_lowercase:
-        tokens = [token.replace("``", '"').replace("''", '"').lower()
-                  for token in nltk.word_tokenize(sequence)]
-    else:
-        tokens = [token.replace("``", '"').replace("''", '"')
-                  for token in nltk.word_tokenize(sequence)]
+        tokens = [token.lower() for token in tokens]
     return tokens
 
 
+def tokenize_with_offsets(sequence, do_lowercase, tokenizer='nltk'):
+    """Same as tokenize, also returns the (start, end) character span of every token in the input sequence"""
+
+    tokens, offsets = get_tokenizer(tokenizer).tokenize_with_offsets(sequence)
+    if do_lowercase:
+        tokens = [token.lower() for token in tokens]
+    return tokens, offsets
+
+
 def total_examples(dataset):
     """Returns the total number of (context, question, answer) triples, given the data loaded from the SQuAD json file"""
     total = 0
@@ -105,21 +161,23 @@ def get_char_word_loc_mapping(context, context_tokens):
         e.g. if context = "hello world" and context_tokens = ["hello", "world"] then
         0,1,2,3,4 are mapped to ("hello", 0) and 6,7,8,9,10 are mapped to ("world", 1)
     """
-    acc = ''  # accumulator
     current_token_idx = 0  # current word loc
+    current_char_idx = 0  # position of the next expected character inside the current word
     mapping = dict()
 
-    # step through original characters
+    # step through original characters, matching every one of them against the next expected character of the
+    # current word, which keeps the whole mapping linear in the length of the context
     for char_idx, char in enumerate(context):
         if char != u' ' and char != u'\n':  # if it's not a space:
-            acc += char  # add to accumulator
+            if current_token_idx == len(context_tokens):
+                return None  # characters left after the last word
             context_token = context_tokens[current_token_idx]  # current word token
-            if acc == context_token:  # if the accumulator now matches the current word token
-                # char loc of the start of this word
-                syn_start = char_idx - len(acc) + 1
-                for char_loc in range(syn_start, char_idx + 1):
-                    mapping[char_loc] = (acc, current_token_idx)  # add to mapping
-                acc = ''  # reset accumulator
+            if current_char_idx >= len(context_token) or context_token[current_char_idx] != char:
+                return None  # the context and the tokens don't line up
+            mapping[char_idx] = (context_token, current_token_idx)  # add to mapping
+            current_char_idx += 1
+            if current_char_idx == len(context_token):  # if the current word token is now complete
+                current_char_idx = 0
                 current_token_idx += 1
 
     if current_token_idx != len(context_tokens):
@@ -128,157 +186,249 @@ def get_char_word_loc_mapping(context, context_tokens):
         return mapping
 
 
-def preprocess_and_write(dataset, tier, out_dir, squad_version, do_lowercase):
-    """Reads the dataset, extracts context, question, answer, tokenizes them, and calculates answer span in terms of token indices.
-    Note: due to tokenization issues, and the fact that the original answer spans are given in terms of characters, some examples are discarded because we cannot get a clean span in terms of tokens.
+@lru_cache(maxsize=100000)
+def tokenize_question(question, do_lowercase, tokenizer='nltk'):
+    """Memoized tokenize for questions, the same question text often comes up several times"""
+    return tuple(tokenize(question, do_lowercase=do_lowercase, tokenizer=tokenizer))
 
-    This function produces the {train/dev}.{context/question/answer/span} files.
 
-    Inputs:
-      dataset: read from JSON
-      tier: string ("train" or "dev")
-      out_dir: directory to write the preprocessed files
+def preprocess_article(article, squad_version, do_lowercase, tokenizer='nltk'):
+    """Extracts and tokenizes the (context, question, answer, span[, is_impossible]) examples of one article.
+
     Returns:
-      the number of (context, question, answer) triples written to file by the dataset.
+      the examples of the article, in order, along with the number of triples discarded because of char -> token
+      mapping problems, token problems and span alignment problems
     """
-
-    num_exs = 0  # number of examples written to file
-    num_mappingprob, num_tokenprob, num_spanalignprob = 0, 0, 0
     examples = []
+    num_mappingprob, num_tokenprob, num_spanalignprob = 0, 0, 0
 
-    for articles_id in tqdm(range(len(dataset['data'])), desc="Preprocessing {}".format(tier)):
+    article_paragraphs = article['paragraphs']
+    for pid in range(len(article_paragraphs)):
 
-        article_paragraphs = dataset['data'][articles_id]['paragraphs']
-        for pid in range(len(article_paragraphs)):
+        context = article_paragraphs[pid]['context'].strip()  # string
 
-            context = article_paragraphs[pid]['context'].strip()  # string
+        # The following replacements are suggested in the paper
+        # BidAF (Seo et al., 2016)
+        context = context.replace("''", '" ')
+        context = context.replace("``", '" ')
 
-            # The following replacements are suggested in the paper
-            # BidAF (Seo et al., 2016)
-            context = context.replace("''", '" ')
-            context = context.replace("``", '" ')
+        context_tokens = tokenize(context, do_lowercase=do_lowercase, tokenizer=tokenizer)  # list of strings (lowercase)
 
-            context_tokens = tokenize(context, do_lowercase=do_lowercase)  # list of strings (lowercase)
+        if do_lowercase:
+            context = context.lower()
 
-            if do_lowercase:
-                context = context.lower()
+        qas = article_paragraphs[pid]['qas']  # list of questions
 
-            qas = article_paragraphs[pid]['qas']  # list of questions
+        # charloc2wordloc maps the character location (int) of a context token to a pair giving (word (string), word loc (int)) of that token
+        charloc2wordloc = get_char_word_loc_mapping(
+            context, context_tokens)
 
-            # charloc2wordloc maps the character location (int) of a context token to a pair giving (word (string), word loc (int)) of that token
-            charloc2wordloc = get_char_word_loc_mapping(
-                context, context_tokens)
+        if charloc2wordloc is None:  # there was a problem
+            num_mappingprob += len(qas)
+            continue  # skip this context example
 
-            if charloc2wordloc is None:  # there was a problem
-                num_mappingprob += len(qas)
-                continue  # skip this context example
+        # for each question, process the question and answer and write to file
+        for qn in qas:
 
-            # for each question, process the question and answer and write to file
-            for qn in qas:
+            # read the question text and tokenize
+            question = qn['question'].strip()  # string
+            question_tokens = tokenize_question(question, do_lowercase, tokenizer)  # tuple of strings
 
-                # read the question text and tokenize
-                question = qn['question'].strip()  # string
-                question_tokens = tokenize(question, do_lowercase=do_lowercase)  # list of strings
+            # of the three answers, just take the first
+            # get the answer text
+            # answer start loc (character count)
+            if squad_version == 1.1:
+                ans_text = qn['answers'][0]['text']
+                ans_start_charloc = qn['answers'][0]['answer_start']
 
-                # of the three answers, just take the first
-                # get the answer text
-                # answer start loc (character count)
-                if squad_version == 1.1:
-                    ans_text = qn['answers'][0]['text']
-                    ans_start_charloc = qn['answers'][0]['answer_start']
+            elif qn['is_impossible'] == True:
+                # some questions in squad 2.0 don't even have plausible answers
+                if qn['plausible_answers'] == []:
+                    continue
 
-                elif qn['is_impossible'] == True:
-                    # some questions in squad 2.0 don't even have plausible answers
-                    if qn['plausible_answers'] == []:
-                        continue
+                is_impossible = 1
+                ans_text = qn['plausible_answers'][0]['text']
+                ans_start_charloc = qn['plausible_answers'][0]['answer_start']
+            else:
+                is_impossible = 0
+                ans_text = qn['answers'][0]['text']
+                ans_start_charloc = qn['answers'][0]['answer_start']
 
-                    is_impossible = 1
-                    ans_text = qn['plausible_answers'][0]['text']
-                    ans_start_charloc = qn['plausible_answers'][0]['answer_start']
-                else:
-                    is_impossible = 0
-                    ans_text = qn['answers'][0]['text']
-                    ans_start_charloc = qn['answers'][0]['answer_start']
+            if do_lowercase:
+                ans_text = ans_text.lower()
+
+            # answer end loc (character count) (exclusive)
+            ans_end_charloc = ans_start_charloc + len(ans_text)
+
+            # Check that the provided character spans match the provided answer text
+            if context[ans_start_charloc:ans_end_charloc] != ans_text:
+                # Sometimes this is misaligned, mostly because "narrow builds" of Python 2 interpret certain Unicode characters to have length 2 https://stackoverflow.com/questions/29109944/python-returns-length-of-2-for-single-unicode-character-string
+                # We should upgrade to Python 3 next year!
+                num_spanalignprob += 1
+                continue
+
+            # get word locs for answer start and end (inclusive)
+            # answer start word loc
+            ans_start_wordloc = charloc2wordloc[ans_start_charloc][1]
+            # answer end word loc
+            ans_end_wordloc = charloc2wordloc[ans_end_charloc - 1][1]
+            assert ans_start_wordloc <= ans_end_wordloc
+
+            # Check retrieved answer tokens match the provided answer text.
+            # Sometimes they won't match, e.g. if the context contains the phrase "fifth-generation"
+            # and the answer character span is around "generation",
+            # but the tokenizer regards "fifth-generation" as a single token.
+            # Then ans_tokens has "fifth-generation" but the ans_text is "generation", which doesn't match.
+            ans_tokens = context_tokens[ans_start_wordloc:ans_end_wordloc + 1]
+            if "".join(ans_tokens) != "".join(ans_text.split()):
+                num_tokenprob += 1
+                continue  # skip this question/answer pair
+
+            if squad_version == 2.0:
+                examples.append((' '.join(context_tokens), ' '.join(question_tokens), ' '.join(
+                    ans_tokens), ' '.join([str(ans_start_wordloc), str(ans_end_wordloc)]), str(is_impossible)))
+            else:
+                examples.append((' '.join(context_tokens), ' '.join(question_tokens), ' '.join(
+                    ans_tokens), ' '.join([str(ans_start_wordloc), str(ans_end_wordloc)])))
 
-                if do_lowercase:
-                    ans_text = ans_text.lower()
+    return examples, num_mappingprob, num_tokenprob, num_spanalignprob
 
-                # answer end loc (character count) (exclusive)
-                ans_end_charloc = ans_start_charloc + len(ans_text)
 
-                # Check that the provided character spans match the provided answer text
-                if context[ans_start_charloc:ans_end_charloc] != ans_text:
-                    # Sometimes this is misaligned, mostly because "narrow builds" of Python 2 interpret certain Unicode characters to have length 2 https://stackoverflow.com/questions/29109944/python-returns-length-of-2-for-single-unicode-character-string
-                    # We should upgrade to Python 3 next year!
-                    num_spanalignprob += 1
-                    continue
+def preprocess_and_write(dataset, tier, out_dir, squad_version, do_lowercase, num_workers=1, tokenizer='nltk',
+                         article_cache=None, source_hash=None, window_size=256):
+    """Reads the dataset, extracts context, question, answer, tokenizes them, and calculates answer span in terms of token indices.
+    Note: due to tokenization issues, and the fact that the original answer spans are given in terms of characters, some examples are discarded because we cannot get a clean span in terms of tokens.
 
-                # get word locs for answer start and end (inclusive)
-                # answer start word loc
-                ans_start_wordloc = charloc2wordloc[ans_start_charloc][1]
-                # answer end word loc
-                ans_end_wordloc = charloc2wordloc[ans_end_charloc - 1][1]
-                assert ans_start_wordloc <= ans_end_wordloc
-
-                # Check retrieved answer tokens match the provided answer text.
-                # Sometimes they won't match, e.g. if the context contains the phrase "fifth-generation"
-                # and the answer character span is around "generation",
-                # but the tokenizer regards "fifth-generation" as a single token.
-                # Then ans_tokens has "fifth-generation" but the ans_text is "generation", which doesn't match.
-                ans_tokens = context_tokens[ans_start_wordloc:ans_end_wordloc + 1]
-                if "".join(ans_tokens) != "".join(ans_text.split()):
-                    num_tokenprob += 1
-                    continue  # skip this question/answer pair
+    This function produces the {train/dev}.{context/question/answer/span} files.
 
-                if squad_version == 2.0:
-                    examples.append((' '.join(context_tokens), ' '.join(question_tokens), ' '.join(
-                        ans_tokens), ' '.join([str(ans_start_wordloc), str(ans_end_wordloc)]), str(is_impossible)))
-                else:
-                    examples.append((' '.join(context_tokens), ' '.join(question_tokens), ' '.join(
-                        ans_tokens), ' '.join([str(ans_start_wordloc), str(ans_end_wordloc)])))
+    Inputs:
+      dataset: read from JSON, or an iterable of articles such as iter_json_array, which are then read one window of
+        window_size articles at a time and never all held in memory
+      tier: string ("train" or "dev")
+      out_dir: directory to write the preprocessed files
+      num_workers: number of processes the articles are shared out to, their examples are merged back in article
+        order so the output doesn't depend on it
+      tokenizer: name of the tokenizer, 'nltk' or 'regex'
+      article_cache: ArticleCache whose articles are reused instead of being preprocessed again, it is then rewritten
+        with the articles of the dataset and source_hash, the hash of the file the dataset was read from
+    Returns:
+      the number of (context, question, answer) triples written to file by the dataset.
+    """
 
-                num_exs += 1
+    num_total = 0  # number of examples in the dataset
+    num_exs = 0  # number of examples written to file
+    num_mappingprob, num_tokenprob, num_spanalignprob = 0, 0, 0
+    num_reused = 0
 
-    print("Number of (context, question, answer) triples discarded due to char -> token mapping problems: ", num_mappingprob)
-    print("Number of (context, question, answer) triples discarded because character-based answer span is unaligned with tokenization: ", num_tokenprob)
-    print("Number of (context, question, answer) triples discarded due character span alignment problems (usually Unicode problems): ", num_spanalignprob)
-    print("Processed %i examples of total %i\n" %
-          (num_exs, num_exs + num_mappingprob + num_tokenprob + num_spanalignprob))
+    process_article = partial(preprocess_article, squad_version=squad_version, do_lowercase=do_lowercase,
+                              tokenizer=tokenizer)
+    articles = iter(dataset['data'] if isinstance(dataset, dict) else dataset)
 
-    # shuffle examples
-    indices = list(range(len(examples)))
-    np.random.shuffle(indices)
+    # the examples are spooled to disk and shuffled there, with a seed of their own so that the order of a tier
+    # doesn't depend on the other tier. The cache is only updated once they are all written out.
+    cache_update = article_cache.update(source_hash) if article_cache is not None else ExitStack()
+    with cache_update, ExternalShuffle(seed=42, temp_dir=out_dir) as examples:
+        pool = Pool(num_workers) if num_workers > 1 else None
+        try:
+            progress = tqdm(desc="Preprocessing {}".format(tier), unit=" articles")
+            while True:
+                window = list(islice(articles, window_size))
+                if not window:
+                    break
+                num_total += sum(len(para['qas']) for article in window for para in article['paragraphs'])
+
+                # only the articles which are new or changed since the cache was written get preprocessed
+                hashes = [article_hash(article) for article in window] if article_cache is not None else []
+                cached_results = article_cache.get(hashes) if article_cache is not None else {}
+                missing_articles = [article for i, article in enumerate(window)
+                                    if article_cache is None or hashes[i] not in cached_results]
+                results = iter(pool.imap(process_article, missing_articles, chunksize=4) if pool is not None else map(
+                    process_article, missing_articles))
+
+                for i in range(len(window)):
+                    if article_cache is not None and hashes[i] in cached_results:
+                        result = cached_results[hashes[i]]
+                        num_reused += 1
+                    else:
+                        result = next(results)
+                    if article_cache is not None:
+                        article_cache.add(hashes[i], result)
+
+                    article_examples, mappingprob, tokenprob, spanalignprob = result
+                    for example in article_examples:
+                        examples.add(json.dumps(example))
+                    num_exs += len(article_examples)
+                    num_mappingprob += mappingprob
+                    num_tokenprob += tokenprob
+                    num_spanalignprob += spanalignprob
+                progress.update(len(window))
+            progress.close()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        print("%s data has %i examples total" % (tier.capitalize(), num_total))
+        if article_cache is not None:
+            print("Reused {} preprocessed articles".format(num_reused))
+        print("Number of (context, question, answer) triples discarded due to char -> token mapping problems: ", num_mappingprob)
+        print("Number of (context, question, answer) triples discarded because character-based answer span is unaligned with tokenization: ", num_tokenprob)
+        print("Number of (context, question, answer) triples discarded due character span alignment problems (usually Unicode problems): ", num_spanalignprob)
+        print("Processed %i examples of total %i\n" %
+              (num_exs, num_exs + num_mappingprob + num_tokenprob + num_spanalignprob))
+
+        with open(os.path.join(out_dir, tier + '-v{}.context'.format(squad_version)), 'w', encoding='utf-8') as context_file, \
+                open(os.path.join(out_dir, tier + '-v{}.question'.format(squad_version)), 'w', encoding='utf-8') as question_file, \
+                open(os.path.join(out_dir, tier + '-v{}.answer'.format(squad_version)), 'w', encoding='utf-8') as ans_text_file, \
+                open(os.path.join(out_dir, tier + '-v{}.span'.format(squad_version)), 'w', encoding='utf-8') as span_file:
 
-    with open(os.path.join(out_dir, tier + '-v{}.context'.format(squad_version)), 'w', encoding='utf-8') as context_file, \
-            open(os.path.join(out_dir, tier + '-v{}.question'.format(squad_version)), 'w', encoding='utf-8') as question_file, \
-            open(os.path.join(out_dir, tier + '-v{}.answer'.format(squad_version)), 'w', encoding='utf-8') as ans_text_file, \
-            open(os.path.join(out_dir, tier + '-v{}.span'.format(squad_version)), 'w', encoding='utf-8') as span_file:
+            if squad_version == 2.0:
+                is_impossible_file = open(os.path.join(
+                    out_dir, tier + '-v{}.is_impossible'.format(squad_version)), 'w', encoding='utf-8')
 
-        if squad_version == 2.0:
-            is_impossible_file = open(os.path.join(
-                out_dir, tier + '-v{}.is_impossible'.format(squad_version)), 'w', encoding='utf-8')
+            for example in examples:
 
-        for i in indices:
+                if squad_version == 2.0:
+                    (context, question, answer, answer_span, is_impossible) = json.loads(example)
+                else:
+                    (context, question, answer, answer_span) = json.loads(example)
 
-            if squad_version == 2.0:
-                (context, question, answer, answer_span, is_impossible) = examples[i]
-            else:
-                (context, question, answer, answer_span) = examples[i]
+                # write tokenized data to file
+                write_to_file(context_file, context)
+                write_to_file(question_file, question)
+                write_to_file(ans_text_file, answer)
+                write_to_file(span_file, answer_span)
 
-            # write tokenized data to file
-            write_to_file(context_file, context)
-            write_to_file(question_file, question)
-            write_to_file(ans_text_file, answer)
-            write_to_file(span_file, answer_span)
+                if squad_version == 2.0:
+                    write_to_file(is_impossible_file, is_impossible)
 
             if squad_version == 2.0:
-                write_to_file(is_impossible_file, is_impossible)
+                is_impossible_file.close()
+
+    return num_exs
 
-        if squad_version == 2.0:
-            is_impossible_file.close()
 
+def maybe_preprocess(tier, filename, data_dir, squad_version, do_lowercase, num_workers=1, tokenizer='nltk'):
+    """Preprocesses a tier unless its source file is unchanged since it was last preprocessed with the same settings,
+    in which case the file isn't even loaded. Otherwise only the new or changed articles are tokenized again."""
+    settings = {"squad_version": squad_version, "do_lowercase": do_lowercase, "tokenizer": tokenizer}
+    article_cache = ArticleCache(os.path.join(data_dir, tier + '-v{}.articles.jsonl'.format(squad_version)), settings)
+    source_hash = file_hash(os.path.join(data_dir, filename))
 
-def data_download_and_preprocess(squad_version=1.1, do_lowercase=True):
+    if article_cache.is_up_to_date(source_hash) and \
+            os.path.isfile(os.path.join(data_dir, tier + '-v{}.context'.format(squad_version))):
+        print("{} data is unchanged since it was last preprocessed".format(tier.capitalize()))
+        return
+
+    # articles are parsed one at a time instead of loading the whole file
+    articles = iter_json_array(os.path.join(data_dir, filename), 'data')
+
+    print("Preprocessing {} data".format(tier))
+    preprocess_and_write(articles, tier, data_dir, squad_version, do_lowercase=do_lowercase, num_workers=num_workers,
+                         tokenizer=tokenizer, article_cache=article_cache, source_hash=source_hash)
+
+
+def data_download_and_preprocess(squad_version=1.1, do_lowercase=True, num_workers=1, tokenizer='nltk'):
     data_dir = os.path.join(base_dir, 'data', 'squad')
 
     print("Will download SQuAD datasets to {} if required".format(data_dir))
@@ -293,25 +443,15 @@ def data_download_and_preprocess(squad_version=1.1, do_lowercase=True):
     # download train set
     maybe_download(SQUAD_BASE_URL, train_filename, data_dir)
 
-    # read train set
-    train_data = data_from_json(os.path.join(data_dir, train_filename))
-    print("Train data has %i examples total" % total_examples(train_data))
-
     # preprocess train set and write to file
-    if not os.path.isfile(os.path.join(data_dir, 'train-v{}.context'.format(squad_version))):
-        print("Preprocessing training data")
-        preprocess_and_write(train_data, 'train', data_dir, squad_version, do_lowercase=do_lowercase)
+    maybe_preprocess('train', train_filename, data_dir, squad_version, do_lowercase=do_lowercase,
+                     num_workers=num_workers, tokenizer=tokenizer)
     print("Train data preprocessed!")
 
     # download dev set
     maybe_download(SQUAD_BASE_URL, dev_filename, data_dir)
 
-    # read dev set
-    dev_data = data_from_json(os.path.join(data_dir, dev_filename))
-    print("Dev data has %i examples total" % total_examples(dev_data))
-
     # preprocess dev set and write to file
-    if not os.path.isfile(os.path.join(data_dir, 'dev-v{}.context'.format(squad_version))):
-        print("Preprocessing development data")
-        preprocess_and_write(dev_data, 'dev', data_dir, squad_version, do_lowercase=do_lowercase)
+    maybe_preprocess('dev', dev_filename, data_dir, squad_version, do_lowercase=do_lowercase,
+                     num_workers=num_workers, tokenizer=tokenizer)
     print("Dev data preprocessed!")
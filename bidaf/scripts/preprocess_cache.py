@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from .line_index import get_index_file, load_line_index, read_lines
+
+
+def file_hash(filename, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def article_hash(article):
+    return hashlib.sha1(json.dumps(article, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ArticleCache():
+    """Preprocessed examples of the articles of one tier, keyed by the content hash of every article.
+
+    The results are stored one article per line in a data file, and the manifest (cache_file.manifest.json) lists the
+    hash of the article on every line along with the hash of the source JSON file and the preprocessing settings they
+    were produced with. A cache made with other settings is ignored. Every update is streamed to a data file of its
+    own, cache_file.<generation>, which only the manifest switches to once finish_update is called. The manifest and
+    the data file it names therefore always match, even if the process dies in between. discard_update drops an
+    update which can't be finished.
+    """
+
+    def __init__(self, cache_file, settings):
+        self.cache_file = cache_file
+        self.manifest_file = cache_file + '.manifest.json'
+        self.settings = settings
+
+        self.manifest = None
+        self.rows = {}
+        self.generation = -1
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.generation = manifest.get("generation", -1)
+            if manifest.get("settings") == settings and os.path.isfile(self.get_data_file(self.generation)):
+                self.manifest = manifest
+                self.rows = {article: row for row, article in enumerate(manifest["articles"])}
+        self.offsets = None
+
+        self.update_file = None
+        self.updated_articles = None
+
+    def get_data_file(self, generation):
+        return '{}.{}'.format(self.cache_file, generation)
+
+    def is_up_to_date(self, source_hash):
+        """Tells whether the cache was built from a source file with the given hash"""
+        return self.manifest is not None and self.manifest["source_hash"] == source_hash
+
+    def get(self, hashes):
+        """Returns the cached results of the articles with the given hashes, as a dict keyed by hash"""
+        hashes = [article for article in set(hashes) if article in self.rows]
+        if not hashes:
+            return {}
+        data_file = self.get_data_file(self.generation)
+        if self.offsets is None:
+            self.offsets = load_line_index(data_file)
+        lines = read_lines(data_file, self.offsets, [self.rows[article] for article in hashes])
+        return {article: json.loads(line) for article, line in zip(hashes, lines)}
+
+    def start_update(self):
+        self.update_file = open(self.get_data_file(self.generation + 1), 'w', encoding='utf-8')
+        self.updated_articles = []
+
+    def add(self, article, result):
+        self.update_file.write(json.dumps(result) + '\n')
+        self.updated_articles.append(article)
+
+    def finish_update(self, source_hash):
+        self.update_file.close()
+        old_data_file = self.get_data_file(self.generation)
+        self.generation += 1
+
+        # the new data file becomes the cache only once the manifest naming it is in place
+        self.manifest = {"source_hash": source_hash, "settings": self.settings, "generation": self.generation,
+                         "articles": self.updated_articles}
+        manifest_file = self.manifest_file + '.tmp'
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_file, self.manifest_file)
+
+        for stale_file in (old_data_file, get_index_file(old_data_file)):
+            if os.path.isfile(stale_file):
+                os.remove(stale_file)
+
+        self.rows = {article: row for row, article in enumerate(self.updated_articles)}
+        self.offsets = None
+        self.update_file = None
+        self.updated_articles = None
+
+    def discard_update(self):
+        if self.update_file is not None:
+            self.update_file.close()
+            os.remove(self.update_file.name)
+        self.update_file = None
+        self.updated_articles = None
+
+    @contextmanager
+    def update(self, source_hash):
+        """Starts an update which is finished once the block exits, or discarded if it raises"""
+        self.start_update()
+        try:
+            yield self
+        except BaseException:
+            self.discard_update()
+            raise
+        self.finish_update(source_hash)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class StageTimer():
+    """Records the wall time spent in every stage of a prediction, in total and per batch, along with the sizes of the
+    batches (batch size, padded passage length P and question length Q)"""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.stages = OrderedDict()
+        self.batches = []
+        self.current_batch = None
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start_time
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            if self.current_batch is not None:
+                self.current_batch[name] = self.current_batch.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def batch(self, **sizes):
+        self.current_batch = OrderedDict(sizes)
+        try:
+            yield self.current_batch
+        finally:
+            self.batches.append(self.current_batch)
+            self.current_batch = None
+
+    def as_dict(self):
+        return {
+            "total": time.time() - self.start_time,
+            "stages": dict(self.stages),
+            "batches": list(self.batches),
+        }
+
+
+class NullTimer():
+    """Stands in for a StageTimer when no timings were asked for"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    @contextmanager
+    def batch(self, **sizes):
+        yield {}
+
+
+class PrometheusSink():
+    """Metrics sink aggregating the timings of predictions into Prometheus summaries, rendered in the Prometheus text
+    format by render(). Any other callable taking the timings dict of a prediction can be used as a sink."""
+
+    def __init__(self, namespace='bidaf'):
+        self.namespace = namespace
+        self.stage_sums = OrderedDict()
+        self.stage_counts = OrderedDict()
+        self.num_predictions = 0
+        self.prediction_time = 0.0
+        self.num_samples = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, timings):
+        with self.lock:
+            self.num_predictions += 1
+            self.prediction_time += timings["total"]
+            self.num_samples += sum(batch.get("batch_size", 0) for batch in timings["batches"])
+            for stage, elapsed in timings["stages"].items():
+                self.stage_sums[stage] = self.stage_sums.get(stage, 0.0) + elapsed
+                self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+
+    def render(self):
+        name = self.namespace + '_predict'
+        with self.lock:
+            lines = [
+                '# HELP {}_seconds Wall time of predict_ans calls.'.format(name),
+                '# TYPE {}_seconds summary'.format(name),
+                '{}_seconds_sum {}'.format(name, self.prediction_time),
+                '{}_seconds_count {}'.format(name, self.num_predictions),
+                '# HELP {}_samples_total Number of samples run through the model.'.format(name),
+                '# TYPE {}_samples_total counter'.format(name),
+                '{}_samples_total {}'.format(name, self.num_samples),
+                '# HELP {}_stage_seconds Wall time of every stage of predict_ans calls.'.format(name),
+                '# TYPE {}_stage_seconds summary'.format(name),
+            ]
+            for stage in self.stage_sums:
+                lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(name, stage, self.stage_sums[stage]))
+                lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(name, stage, self.stage_counts[stage]))
+        return '\n'.join(lines) + '\n'
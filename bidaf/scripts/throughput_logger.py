@@ -0,0 +1,76 @@
+import sys
+import time
+from keras.callbacks import Callback
+
+try:
+    import resource
+except ImportError:
+    # Unix only, psutil measures the peak memory on Windows
+    resource = None
+
+
+def process_peak_rss_mb():
+    """Returns the peak resident set size of the process since it started, in MB, or None if it can't be measured"""
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak_rss / 1024.0
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # the peak working set, only reported on Windows
+    peak_rss = getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    return peak_rss / (1024.0 * 1024.0) if peak_rss is not None else None
+
+
+class ThroughputLogger(Callback):
+    """Adds the training throughput of every epoch to its logs, so CSVLogger and TensorBoard record it.
+
+    The time between the end of a step and the beginning of the next one is spent waiting for the next batch, while
+    the time in between is compute. The logs get examples_per_sec, tokens_per_sec (non-padding passage and question
+    tokens of the batches the BatchGenerator given as generator served), mean_step_time, data_wait_time, compute_time,
+    data_wait_fraction and process_peak_rss_mb. The latter is the peak resident set size of the whole process since it
+    started, not of the epoch alone, and is left out where it can't be measured.
+    """
+
+    def __init__(self, generator=None):
+        super(ThroughputLogger, self).__init__()
+        self.generator = generator
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start_time = time.time()
+        self.last_batch_end_time = self.epoch_start_time
+        self.data_wait_time = 0.0
+        self.compute_time = 0.0
+        self.num_steps = 0
+        self.num_examples = 0
+        self.tokens_at_epoch_begin = getattr(self.generator, 'num_tokens_served', 0)
+
+    def on_batch_begin(self, batch, logs=None):
+        self.batch_start_time = time.time()
+        self.data_wait_time += self.batch_start_time - self.last_batch_end_time
+
+    def on_batch_end(self, batch, logs=None):
+        self.last_batch_end_time = time.time()
+        self.compute_time += self.last_batch_end_time - self.batch_start_time
+        self.num_steps += 1
+        self.num_examples += (logs or {}).get('size', 0)
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is None:
+            return
+        # measured up to the last training step, the validation run isn't part of the training throughput
+        train_time = max(self.last_batch_end_time - self.epoch_start_time, 1e-9)
+        num_tokens = getattr(self.generator, 'num_tokens_served', 0) - self.tokens_at_epoch_begin
+
+        logs['examples_per_sec'] = self.num_examples / train_time
+        logs['tokens_per_sec'] = num_tokens / train_time
+        logs['mean_step_time'] = self.compute_time / self.num_steps if self.num_steps else 0.0
+        logs['data_wait_time'] = self.data_wait_time
+        logs['compute_time'] = self.compute_time
+        logs['data_wait_fraction'] = self.data_wait_time / train_time
+        peak_rss = process_peak_rss_mb()
+        if peak_rss is not None:
+            logs['process_peak_rss_mb'] = peak_rss
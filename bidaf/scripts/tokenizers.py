@@ -0,0 +1,95 @@
+import re
+import nltk
+
+
+class NltkTokenizer():
+    """Tokenizes with nltk's word_tokenize and replaces the two single quotes tokens with a double quote"""
+
+    def tokenize(self, sequence):
+        return [token.replace("``", '"').replace("''", '"') for token in nltk.word_tokenize(sequence)]
+
+    def tokenize_with_offsets(self, sequence):
+        """Returns the tokens along with the (start, end) character span of every token in sequence. nltk doesn't
+        keep track of them so every token is searched for after the end of the previous one."""
+        tokens, offsets = [], []
+        position = 0
+        for token in nltk.word_tokenize(sequence):
+            # word_tokenize turns the double quotes of the text into `` and ''
+            candidates = [token, '"'] if token in ("``", "''") else [token]
+            start, found = -1, token
+            for candidate in candidates:
+                start = sequence.find(candidate, position)
+                if start != -1:
+                    found = candidate
+                    break
+            if start == -1:
+                raise ValueError("Unable to locate token '{}' in the input sequence".format(token))
+            position = start + len(found)
+            tokens.append(token.replace("``", '"').replace("''", '"'))
+            offsets.append((start, position))
+        return tokens, offsets
+
+
+class RegexTokenizer():
+    """Single compiled regular expression close to nltk's Treebank tokenization, without its sentence splitting.
+
+    Double quotes, `` and '' come out as ", the same as NltkTokenizer. Clitics are split from their word ("do", "n't",
+    "it", "'s"), hyphenated words, numbers such as 1,000.5 and words starting with digits such as 1990s or 3rd are kept
+    whole, and every other punctuation mark is a token of its own. Character offsets come straight from the matches.
+    """
+
+    TOKEN_PATTERN = re.compile(r"""
+        ``|''|"                                 # quotes
+        | \.\.\.                                # ellipsis
+        | (?:[^\W\d_]\.){2,}                    # acronyms such as U.S.
+        | \d+(?:[.,:]\d+)*[^\W_]*(?:-\w+)*      # numbers, times, 1990s, 19th-century
+        | \w+(?=n't\b)                          # the word before n't
+        | n't\b
+        | '(?:s|re|ve|ll|d|m)\b                 # clitics
+        | \w+(?:-\w+)*                          # words, hyphenated words
+        | [^\w\s]                               # any other punctuation mark
+    """, re.UNICODE | re.IGNORECASE | re.VERBOSE)
+
+    def tokenize(self, sequence):
+        return self.tokenize_with_offsets(sequence)[0]
+
+    def tokenize_with_offsets(self, sequence):
+        tokens, offsets = [], []
+        for match in RegexTokenizer.TOKEN_PATTERN.finditer(sequence):
+            token = match.group()
+            tokens.append('"' if token in ("``", "''") else token)
+            offsets.append(match.span())
+        return tokens, offsets
+
+
+TOKENIZERS = {
+    'nltk': NltkTokenizer,
+    'regex': RegexTokenizer,
+}
+
+_tokenizers = {}
+
+
+def get_tokenizer(name='nltk'):
+    """Returns the (shared) tokenizer registered under name"""
+    if name not in TOKENIZERS:
+        raise ValueError("Unknown tokenizer '{}', must be one of: {}".format(name, ', '.join(sorted(TOKENIZERS))))
+    if name not in _tokenizers:
+        _tokenizers[name] = TOKENIZERS[name]()
+    return _tokenizers[name]
+
+
+def compare_tokenizers(sequences, tokenizer='regex', reference='nltk', max_differences=20):
+    """Tokenizes sequences, e.g. SQuAD contexts, with both tokenizers. Returns the fraction of sequences tokenized the
+    same way along with the (reference tokens, tokens) of up to max_differences of the other ones."""
+    num_sequences, num_same = 0, 0
+    differences = []
+    for sequence in sequences:
+        reference_tokens = get_tokenizer(reference).tokenize(sequence)
+        tokens = get_tokenizer(tokenizer).tokenize(sequence)
+        num_sequences += 1
+        if tokens == reference_tokens:
+            num_same += 1
+        elif len(differences) < max_differences:
+            differences.append((reference_tokens, tokens))
+    return (num_same / num_sequences if num_sequences else 1.0), differences